@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Coalesced GETs are buffered in full to be shared, which gives up streaming of large bodies
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "false").lower() == "true"
+# Followers only join an in-flight call that started less than this long ago
+COALESCE_WINDOW_MS = int(os.getenv("COALESCE_WINDOW_MS", "1000"))
+
+
+@dataclass
+class UpstreamReply:
+    """Fully buffered upstream response that can be shared between waiters."""
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+
+
+class SingleFlight:
+    """
+    Collapse identical concurrent calls into one.
+
+    The first caller for a key starts the call as an independent task and
+    every caller arriving within the window awaits the same task, so a
+    disconnecting client never cancels the call for the others.
+    """
+
+    def __init__(self, window_ms: int = COALESCE_WINDOW_MS):
+        self.window = window_ms / 1000
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls: Dict[Hashable, Tuple[float, asyncio.Task]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[UpstreamReply]]) -> UpstreamReply:
+        """
+        Run `fn` once per key and share its result with concurrent callers.
+        Args:
+            key: Identity of the call
+            fn: Coroutine function performing the call
+        Returns:
+            The shared reply
+        """
+        call = self._calls.get(key)
+        if call and time.monotonic() - call[0] <= self.window:
+            self.coalesced += 1
+            return await asyncio.shield(call[1])
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = (time.monotonic(), task)
+        self.leaders += 1
+        task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        """Drop a finished call unless a newer one replaced it."""
+        call = self._calls.get(key)
+        if call and call[1] is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return coalescing counters."""
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "window_ms": int(self.window * 1000),
+        }
+
+
+single_flight = SingleFlight()
@@ -1,4 +1,6 @@
 from fastapi import FastAPI, Request, HTTPException, Security, Depends
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import jwt
 import uuid
@@ -6,12 +8,17 @@ import os
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 import logging
-from rediscache import cache_exists, store_session
-from typing import Tuple, Dict, Any, Optional
+import time
+from common.rediscache import cache_exists, store_session, logout_user, close_redis
+from sessioncache import session_cache, listen_for_revocations
+from ratelimit import rate_limiter, RateLimitResult
+from upstreams import start_clients, close_clients, get_pool, parse_urls, pools, Upstream, UpstreamPool
+from coalesce import single_flight, UpstreamReply, COALESCE_ENABLED
+from typing import Tuple, Dict, Any, Optional, Callable, Awaitable
 
 
 # Configuration
@@ -19,6 +26,21 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "mysecretkey")
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_MINUTES = int(os.getenv("TOKEN_EXPIRE_MINUTES", "60"))
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
+# Stream bodies through the gateway; set to false to buffer each upstream reply
+STREAMING_PROXY = os.getenv("STREAMING_PROXY", "true").lower() == "true"
+
+# Total time budget for a proxied request, propagated downstream as an absolute deadline
+REQUEST_TIMEOUT_MS = int(os.getenv("REQUEST_TIMEOUT_MS", "10000"))
+DEADLINE_HEADER = "x-request-deadline"
+# Send a second attempt for idempotent reads that exceed the service p95 latency
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD"})
+
+# Connection-specific headers that are never forwarded (RFC 9110 section 7.6.1)
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade"
+})
 
 
 logging.basicConfig(
@@ -27,14 +49,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Define backend microservices URLs
+# Define backend microservices URLs, each service accepts a comma separated list of upstreams
 MICROSERVICES = {
-    "queries": os.environ.get("PREPROCESSING_URL")
+    "queries": parse_urls(os.environ.get("PREPROCESSING_URL"))
 }
 
 # Security Token Bearer
 security = HTTPBearer()
-limiter = Limiter(key_func=get_remote_address)
 
 class UserLogin(BaseModel):
     username: str
@@ -45,13 +66,24 @@ class TokenResponse(BaseModel):
     access_token: Dict[str, Any]
     token_type: str
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open pooled upstream clients on startup and close them on shutdown."""
+    await start_clients(MICROSERVICES)
+    revocation_listener = asyncio.create_task(listen_for_revocations())
+    yield
+    revocation_listener.cancel()
+    await close_clients()
+    await close_redis()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AdaptAI API Gateway",
     description="API Gateway for routing requests to microservices",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
-app.state.limiter = limiter
 
 # Add CORS middleware
 app.add_middleware(
@@ -59,11 +91,13 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS, #TODO: restrict to clients of the API
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # Let browser clients read proxied validators and rate limit state
+    expose_headers=["ETag", "X-Next-Cursor", "Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"]
 )
 
 # Generate JWT token
-def create_jwt_token(username: str) -> Dict[str, Any]:
+async def create_jwt_token(username: str) -> Dict[str, Any]:
     """
     Create a JWT token for user authentication.
     Args:
@@ -82,14 +116,14 @@ def create_jwt_token(username: str) -> Dict[str, Any]:
         "exp": expiration
     }
     token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
-    store_session(username,session_id,token,ttl)
+    await store_session(username,session_id,token,ttl)
     response = {
         'token': token,
         'expires_in': TOKEN_EXPIRE_MINUTES * 60
     }
     return response
 
-def verify_jwt(token: str) -> Tuple[str, str]:
+async def verify_jwt(token: str) -> Tuple[str, str]:
     """
     Verify JWT Token and extract user info.
     Args:
@@ -104,12 +138,16 @@ def verify_jwt(token: str) -> Tuple[str, str]:
         user_id = payload["user_id"]
         session_id = payload["session_id"]
 
-        # Check if session exists in Redis
+        # Check the local cache before asking Redis if the session exists
         session_key = f"session:{user_id}:{session_id}"
+        if session_cache.contains(session_key):
+            return user_id, session_id
 
-        if not cache_exists(session_key):
-            return None  # Session does not exist or expired
+        if not await cache_exists(session_key):
+            logger.error(f"Session not found: {session_key}")
+            raise HTTPException(status_code=401, detail="Session expired or revoked")
 
+        session_cache.add(session_key, payload["exp"])
         return user_id, session_id
     except jwt.ExpiredSignatureError:
         logger.error(f"JWT Expired: {token}")
@@ -129,11 +167,34 @@ async def get_user_from_token(
     Returns:
         Tuple of (user_id, session_id)
     """
-    return verify_jwt(credentials.credentials)
+    return await verify_jwt(credentials.credentials)
+
+async def enforce_rate_limit(
+        service_name: str,
+        request: Request,
+        user_info: Tuple[str, str] = Depends(get_user_from_token)
+) -> RateLimitResult:
+    """
+    Dependency that applies the per-user rate limit for the target route.
+    Args:
+        service_name: Name of the service to forward to
+        request: Original request
+        user_info: User ID and session ID from token
+    Returns:
+        The rate limit result used to build response headers
+    Raises:
+        HTTPException: 429 with `Retry-After` when the limit is exceeded
+    """
+    user_id, _ = user_info
+    result = await rate_limiter.hit(user_id, service_name, request.method, request.url.path)
+    if not result.allowed:
+        logger.info(f"Rate limit exceeded for {user_id} on {service_name}")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=result.headers())
+    return result
 
 # User login
 @app.post("/login", response_model=TokenResponse)
-def login(user: UserLogin) -> TokenResponse:
+async def login(user: UserLogin) -> TokenResponse:
     """
     Authenticate user and generate JWT token.
     Args:
@@ -145,78 +206,307 @@ def login(user: UserLogin) -> TokenResponse:
     """
     # Validate the username and password.
     if user.username == "admin" and user.password == "password":
-        token = create_jwt_token(user.username)
+        token = await create_jwt_token(user.username)
         return {"access_token": token, "token_type": "bearer"}
 
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
+@app.post("/logout")
+async def logout(user_info: Tuple[str, str] = Depends(get_user_from_token)) -> Dict[str, bool]:
+    """
+    Revoke the current session on every gateway worker.
+    Args:
+        user_info: User ID and session ID from token
+    Returns:
+        Whether the session was removed
+    """
+    user_id, session_id = user_info
+    session_cache.invalidate(f"session:{user_id}:{session_id}")
+    return {"logged_out": await logout_user(user_id, session_id)}
+
+@app.get("/stats")
+def stats(user_info: Tuple[str, str] = Depends(get_user_from_token)) -> Dict[str, Any]:
+    """Expose gateway cache counters to authenticated callers."""
+    return {
+        "session_cache": session_cache.stats(),
+        "upstreams": {name: pool.stats() for name, pool in pools.items()},
+        "coalescing": single_flight.stats()
+    }
+
 @app.get("/")
 def health_check() -> Dict[str, str]:
     """Simple health check endpoint."""
     return {"status": "healthy", "message": "API Gateway is running"}
 
 
-async def forward_request(
-        service_name: str,
+def filter_headers(headers: Any, excluded: frozenset = HOP_BY_HOP_HEADERS) -> Dict[str, str]:
+    """
+    Drop hop-by-hop headers that must not be proxied.
+    Args:
+        headers: Incoming or upstream headers
+        excluded: Lower-case header names to drop
+    Returns:
+        Headers safe to pass through the proxy
+    """
+    return {key: value for key, value in headers.items() if key.lower() not in excluded}
+
+
+def request_deadline(request: Request) -> float:
+    """
+    Compute the absolute deadline for a request.
+    Args:
+        request: Original request, which may carry a tighter client deadline
+    Returns:
+        Deadline as a Unix timestamp in seconds
+    """
+    deadline = time.time() + REQUEST_TIMEOUT_MS / 1000
+    client_deadline = request.headers.get(DEADLINE_HEADER)
+    if client_deadline:
+        try:
+            deadline = min(deadline, float(client_deadline) / 1000)
+        except ValueError:
+            pass
+    return deadline
+
+
+async def send_upstream(
+        pool: UpstreamPool,
         request: Request,
-        headers: dict) -> Dict[str, Any]:
+        headers: dict,
+        deadline: float,
+        upstream: Optional[Upstream] = None) -> Tuple[httpx.Response, Callable[..., Awaitable[None]]]:
     """
-    Forward request from API Gateway to the target microservice.
+    Send the request to the best available instance of a service.
     Args:
-        service_name: Name of the service to forward to
+        pool: Upstream pool of the target service
         request: Original FastAPI request
         headers: Headers to include in the forwarded request
+        deadline: Absolute request deadline, propagated downstream
+        upstream: Instance to use instead of letting the pool choose
     Returns:
-        JSON response from the microservice
+        Tuple of (streaming upstream response, coroutine function that closes it)
+    Raises:
+        HTTPException: 503 if no instance is available or the request fails,
+            504 if the deadline passes before the upstream answers
     """
-    if service_name not in MICROSERVICES:
-        logger.error(f"Service {service_name} not found.")
-        return {"error": "Service not found"}
+    upstream = upstream or pool.choose()
+    if upstream is None:
+        # Every instance is unhealthy or has an open breaker: fail fast
+        logger.error(f"No healthy upstream for {pool.service_name}")
+        raise HTTPException(status_code=503, detail="Service unavailable")
+
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
 
-    service_url = f"{MICROSERVICES[service_name]}{request.url.path}"
     method = request.method
-    body = await request.body()
+    client = upstream.client
+    logger.info(f"Forwarding request: {method} {upstream.base_url}{request.url.path}")
 
-    logger.info(f"Forwarding request: {method} {service_url}")
+    upstream_headers = filter_headers(headers, HOP_BY_HOP_HEADERS | {"host"})
+    upstream_headers[DEADLINE_HEADER] = str(int(deadline * 1000))
+    upstream_request = client.build_request(
+        method,
+        request.url.path,
+        # Reads carry no body, which lets a hedged attempt resend them
+        content=None if method in IDEMPOTENT_METHODS else request.stream(),
+        headers=upstream_headers,
+        params=request.query_params
+    )
+    upstream.acquire()
+    started = time.monotonic()
+    try:
+        response = await asyncio.wait_for(client.send(upstream_request, stream=True), remaining)
+    except asyncio.TimeoutError:
+        upstream.release(success=False)
+        logger.error(f"Deadline exceeded waiting for {upstream.base_url}")
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    except httpx.RequestError as e:
+        upstream.release(success=False)
+        logger.error(f"HTTP request failed: {str(e)}")
+        raise HTTPException(status_code=503, detail="Service unavailable")
+    except BaseException:
+        # Lost a hedging race, the client went away or the request body could not be read
+        upstream.release(success=None)
+        raise
+    pool.record_latency(time.monotonic() - started)
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.request(
-                method,
-                service_url,
-                content=body,
-                headers=headers,
-                params=request.query_params
-            )
+    # Log Response Status First
+    logger.info(f"Response Status: {response.status_code}")
 
-            # Log Response Status First
-            logger.info(f"Response Status: {response.status_code}")
+    async def finish(failed: Optional[bool] = False) -> None:
+        await response.aclose()
+        upstream.release(success=None if failed is None else not failed and response.status_code < 500)
 
-            if response.status_code >= 400:
-                logger.error(f"Error Response: {response.text}")
+    return response, finish
 
-            return response.json()
-        except httpx.RequestError as e:
-            logger.error(f"HTTP request failed: {str(e)}")
-            raise HTTPException(status_code=503, detail="Service unavailable")
+
+async def read_upstream(
+        pool: UpstreamPool,
+        request: Request,
+        headers: dict,
+        deadline: float,
+        upstream: Optional[Upstream] = None) -> UpstreamReply:
+    """
+    Send the request upstream and buffer the whole reply.
+    Args:
+        pool: Upstream pool of the target service
+        request: Original FastAPI request
+        headers: Headers to include in the forwarded request
+        deadline: Absolute request deadline
+        upstream: Instance to use instead of letting the pool choose
+    Returns:
+        The buffered upstream reply
+    """
+    response, finish = await send_upstream(pool, request, headers, deadline, upstream)
+    try:
+        content = b"".join([chunk async for chunk in response.aiter_raw()])
+    except httpx.RequestError as e:
+        await finish(failed=True)
+        logger.error(f"HTTP response read failed: {str(e)}")
+        raise HTTPException(status_code=503, detail="Service unavailable")
+    except BaseException:
+        await finish(failed=None)
+        raise
+    await finish()
+
+    if response.status_code >= 400:
+        logger.error(f"Error Response: {content[:1024]!r}")
+    return UpstreamReply(response.status_code, filter_headers(response.headers), content)
+
+
+async def hedged_read(pool: UpstreamPool, request: Request, headers: dict, deadline: float) -> UpstreamReply:
+    """
+    Buffered read that sends a second attempt to another instance once the
+    first has been outstanding longer than the service's p95 latency.
+    Only idempotent methods are hedged, others get a single buffered attempt.
+    Whichever attempt answers first without a server error wins.
+    Args:
+        pool: Upstream pool of the target service
+        request: Original FastAPI request
+        headers: Headers to include in the forwarded request
+        deadline: Absolute request deadline
+    Returns:
+        The winning upstream reply
+    """
+    threshold = pool.latency_p95()
+    primary = pool.choose()
+    # Writes are never sent twice, their body can only be streamed once
+    if not HEDGE_ENABLED or request.method not in IDEMPOTENT_METHODS or threshold is None or primary is None:
+        return await read_upstream(pool, request, headers, deadline, primary)
+
+    first = asyncio.ensure_future(read_upstream(pool, request, headers, deadline, primary))
+    done, _ = await asyncio.wait({first}, timeout=threshold)
+    secondary = None if done else pool.choose(exclude=[primary])
+    if secondary is None:
+        return await first
+
+    pool.hedges_sent += 1
+    logger.info(f"Hedging {request.url.path} to {secondary.base_url} after {threshold:.3f}s")
+    second = asyncio.ensure_future(read_upstream(pool, request, headers, deadline, secondary))
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    if task is second:
+                        pool.hedges_won += 1
+                    return task.result()
+        # Both attempts failed: surface the primary outcome
+        return await first
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def forward_request(
+        pool: UpstreamPool,
+        request: Request,
+        headers: dict,
+        deadline: float) -> Response:
+    """
+    Forward request from API Gateway to the target microservice.
+    The request body is streamed upstream and the upstream status, headers
+    and body bytes are passed back unchanged.
+    Args:
+        pool: Upstream pool of the service to forward to
+        request: Original FastAPI request
+        headers: Headers to include in the forwarded request
+        deadline: Absolute request deadline
+    Returns:
+        Response relayed from the microservice
+    """
+    if not STREAMING_PROXY or (HEDGE_ENABLED and request.method in IDEMPOTENT_METHODS):
+        reply = await hedged_read(pool, request, headers, deadline)
+        return Response(content=reply.content, status_code=reply.status_code, headers=reply.headers)
+
+    response, finish = await send_upstream(pool, request, headers, deadline)
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=filter_headers(response.headers),
+        background=BackgroundTask(finish)
+    )
+
+
+async def coalesced_request(
+        pool: UpstreamPool,
+        request: Request,
+        headers: dict,
+        user_info: Tuple[str, str],
+        deadline: float) -> Response:
+    """
+    Forward a GET, sharing one upstream call between identical in-flight requests.
+    Args:
+        pool: Upstream pool of the service to forward to
+        request: Original FastAPI request
+        headers: Headers to include in the forwarded request
+        user_info: User ID and session ID from token
+        deadline: Absolute request deadline
+    Returns:
+        Response built from the shared upstream reply
+    """
+    key = (
+        pool.service_name,
+        request.url.path,
+        request.url.query,
+        user_info,
+        request.headers.get("if-none-match"),
+        request.headers.get("accept-encoding"),
+    )
+    reply = await single_flight.do(key, lambda: hedged_read(pool, request, headers, deadline))
+    return Response(content=reply.content, status_code=reply.status_code, headers=reply.headers)
 
 @app.api_route("/{service_name}/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-@limiter.limit("5/minute")
 async def gateway(
         service_name: str,
         request: Request,
-        user_info: Tuple[str, str] = Depends(get_user_from_token)) -> Any:
+        user_info: Tuple[str, str] = Depends(get_user_from_token),
+        rate_limit: RateLimitResult = Depends(enforce_rate_limit)) -> Response:
     """
     Generic API Gateway endpoint for forwarding to all microservices.
     Args:
         service_name: Name of the service to forward to
         request: Original request
         user_info: User ID and session ID from token
+        rate_limit: Rate limit state for this user and route
     Returns:
         Response from the microservice
     """
+    pool = get_pool(service_name)
+    if pool is None:
+        logger.error(f"Service {service_name} not found.")
+        return JSONResponse(status_code=404, content={"error": "Service not found"})
+
     user_id, session_id = user_info
     modified_headers = dict(request.headers)
     modified_headers["user-id"] = user_id
     modified_headers["session-id"] = session_id
-    return await forward_request(service_name, request, modified_headers)
+    deadline = request_deadline(request)
+    if COALESCE_ENABLED and request.method == "GET":
+        response = await coalesced_request(pool, request, modified_headers, user_info, deadline)
+    else:
+        response = await forward_request(pool, request, modified_headers, deadline)
+    response.headers.update(rate_limit.headers())
+    return response
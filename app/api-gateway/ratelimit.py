@@ -0,0 +1,142 @@
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from common.rediscache import redis_client
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Limits are "<requests>/<period>", e.g. "5/minute"
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "5/minute")
+# Comma separated overrides keyed by "<service>" or "<service>:<METHOD>:<path>"
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Token bucket evaluated atomically in Redis using the server clock, so the
+# limit holds across any number of gateway workers and replicas.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) / refill)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill))
+return {allowed, math.floor(tokens), retry_after, math.ceil((capacity - tokens) / refill)}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a rate limit check, times are in milliseconds."""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after_ms: int
+    reset_ms: int
+
+    def headers(self) -> Dict[str, str]:
+        """Build the `X-RateLimit-*` and `Retry-After` response headers."""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_ms / 1000)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after_ms / 1000)))
+        return headers
+
+
+def parse_limit(limit: str) -> Tuple[int, int]:
+    """
+    Parse a limit such as "5/minute".
+    Args:
+        limit: Requests per period
+    Returns:
+        Tuple of (requests, period in seconds)
+    """
+    count, period = limit.strip().split("/")
+    return int(count), PERIODS[period.strip().rstrip("s")]
+
+
+def parse_limits(config: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parse the RATE_LIMITS override list.
+    Args:
+        config: Comma separated `key=limit` pairs
+    Returns:
+        Mapping of limit key to (requests, period in seconds)
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in config.split(","))):
+        key, limit = item.rsplit("=", 1)
+        limits[key.strip()] = parse_limit(limit)
+    return limits
+
+
+class RateLimiter:
+    """Per-user token bucket limiter with per-service and per-route limits."""
+
+    def __init__(self, default: str = RATE_LIMIT_DEFAULT, overrides: str = RATE_LIMITS):
+        self.default = parse_limit(default)
+        self.overrides = parse_limits(overrides)
+        self.script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def resolve(self, service_name: str, method: str, path: str) -> Tuple[str, Tuple[int, int]]:
+        """
+        Find the most specific limit for a request.
+        Args:
+            service_name: Name of the target service
+            method: HTTP method
+            path: Request path
+        Returns:
+            Tuple of (limit key, (requests, period in seconds))
+        """
+        route_key = f"{service_name}:{method}:{path}"
+        if route_key in self.overrides:
+            return route_key, self.overrides[route_key]
+        if service_name in self.overrides:
+            return service_name, self.overrides[service_name]
+        return service_name, self.default
+
+    async def hit(self, user_id: str, service_name: str, method: str, path: str) -> RateLimitResult:
+        """
+        Consume one token for the user and report whether the request may proceed.
+        Args:
+            user_id: User identifier from the JWT
+            service_name: Name of the target service
+            method: HTTP method
+            path: Request path
+        Returns:
+            The rate limit result, allowing the request if Redis is unavailable
+        """
+        limit_key, (capacity, period) = self.resolve(service_name, method, path)
+        refill_per_ms = capacity / (period * 1000)
+        try:
+            allowed, remaining, retry_after, reset = await self.script(
+                keys=[f"ratelimit:{user_id}:{limit_key}"],
+                args=[capacity, refill_per_ms],
+            )
+        except RedisError as e:
+            # Fail open: an unavailable limiter must not take the gateway down
+            logger.error(f"Rate limiter unavailable: {e}")
+            return RateLimitResult(True, capacity, capacity, 0, 0)
+        return RateLimitResult(bool(allowed), capacity, int(remaining), int(retry_after), int(reset))
+
+
+rate_limiter = RateLimiter()
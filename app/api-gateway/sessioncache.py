@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict
+
+from common.rediscache import redis_client, SESSION_REVOKED_CHANNEL
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))  # seconds
+
+
+class SessionCache:
+    """
+    Bounded TTL/LRU cache of sessions already validated against Redis.
+
+    Entries expire after `ttl` seconds or at the token expiry, whichever
+    comes first, and are dropped as soon as a revocation is received.
+    """
+
+    def __init__(self, maxsize: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+
+    def contains(self, session_key: str) -> bool:
+        """
+        Check whether a session is cached and still valid.
+        Args:
+            session_key: Redis session key
+        Returns:
+            True on a cache hit, False otherwise
+        """
+        expires_at = self._entries.get(session_key)
+        if expires_at is None:
+            self.misses += 1
+            return False
+        if expires_at <= time.time():
+            del self._entries[session_key]
+            self.misses += 1
+            return False
+        self._entries.move_to_end(session_key)
+        self.hits += 1
+        return True
+
+    def add(self, session_key: str, token_exp: float) -> None:
+        """
+        Cache a validated session.
+        Args:
+            session_key: Redis session key
+            token_exp: Token expiry as a Unix timestamp
+        """
+        self._entries[session_key] = min(time.time() + self.ttl, token_exp)
+        self._entries.move_to_end(session_key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, session_key: str) -> None:
+        """
+        Drop a revoked session.
+        Args:
+            session_key: Redis session key
+        """
+        if self._entries.pop(session_key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every cached session."""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters for sizing."""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+session_cache = SessionCache()
+
+
+async def listen_for_revocations() -> None:
+    """
+    Drop revoked sessions from the local cache as they are published.
+    Runs until cancelled and resubscribes after Redis connection errors.
+    """
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(SESSION_REVOKED_CHANNEL)
+            while True:
+                # Poll with a timeout so an idle channel never trips the socket timeout
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and isinstance(message.get("data"), str):
+                    session_cache.invalidate(message["data"])
+                    logger.info(f"Session revoked: {message['data']}")
+        except RedisError as e:
+            # Anything revoked while disconnected may still be cached, so start clean
+            logger.error(f"Session revocation listener error: {e}")
+            session_cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
@@ -0,0 +1,301 @@
+import asyncio
+import httpx
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Connection pool defaults shared by every upstream client
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+
+# Health probing and circuit breaking
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1"))
+HEALTH_CHECK_PATH = os.getenv("HEALTH_CHECK_PATH", "/health")
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "10"))
+
+# Latency samples kept per service to estimate the hedging threshold
+LATENCY_SAMPLE_SIZE = int(os.getenv("LATENCY_SAMPLE_SIZE", "200"))
+LATENCY_MIN_SAMPLES = int(os.getenv("LATENCY_MIN_SAMPLES", "20"))
+
+
+def _service_setting(service_name: str, setting: str, default):
+    """
+    Read a per-upstream override such as `QUERIES_READ_TIMEOUT`.
+    Args:
+        service_name: Name of the upstream service
+        setting: Setting suffix to look up
+        default: Value used when no override is configured
+    Returns:
+        The configured value for this upstream
+    """
+    value = os.getenv(f"{service_name.upper()}_{setting}")
+    return type(default)(value) if value else default
+
+
+def create_client(service_name: str, base_url: str) -> httpx.AsyncClient:
+    """
+    Build a pooled, keep-alive HTTP client for a single upstream.
+    Args:
+        service_name: Name of the upstream service
+        base_url: Base URL of the upstream instance
+    Returns:
+        Configured AsyncClient
+    """
+    timeout = httpx.Timeout(
+        connect=_service_setting(service_name, "CONNECT_TIMEOUT", UPSTREAM_CONNECT_TIMEOUT),
+        read=_service_setting(service_name, "READ_TIMEOUT", UPSTREAM_READ_TIMEOUT),
+        write=_service_setting(service_name, "READ_TIMEOUT", UPSTREAM_READ_TIMEOUT),
+        pool=UPSTREAM_POOL_TIMEOUT,
+    )
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=timeout,
+        limits=limits,
+        http2=UPSTREAM_HTTP2,
+    )
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    Opens after `failure_threshold` consecutive failures, lets a single
+    trial request through after `reset_timeout` seconds and closes again
+    once that trial succeeds.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self,
+                 failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent to the upstream."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        return self.state == self.HALF_OPEN and not self.trial_in_flight
+
+    def on_dispatch(self) -> None:
+        """Mark the trial request as in flight while half open."""
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call."""
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Count a failure and open the breaker once the threshold is reached."""
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class Upstream:
+    """A single upstream instance with its client, load and health state."""
+
+    def __init__(self, service_name: str, base_url: str):
+        self.base_url = base_url
+        self.client = create_client(service_name, base_url)
+        self.breaker = CircuitBreaker()
+        self.healthy = True
+        self.outstanding = 0
+
+    def available(self) -> bool:
+        """Return True if the instance is healthy and its breaker allows traffic."""
+        return self.healthy and self.breaker.allow_request()
+
+    def acquire(self) -> None:
+        """Track a request being sent to this instance."""
+        self.outstanding += 1
+        self.breaker.on_dispatch()
+
+    def release(self, success: Optional[bool]) -> None:
+        """
+        Track a finished request.
+        Args:
+            success: Whether the upstream answered without a server error,
+                None if the request was abandoned before an outcome was known
+        """
+        self.outstanding -= 1
+        if success is None:
+            self.breaker.trial_in_flight = False
+        elif success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def stats(self) -> Dict[str, object]:
+        """Return load and health state for this instance."""
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "breaker": self.breaker.state,
+            "outstanding": self.outstanding,
+        }
+
+
+class UpstreamPool:
+    """Load balances one service across its upstream instances."""
+
+    def __init__(self, service_name: str, base_urls: Sequence[str]):
+        self.service_name = service_name
+        self.upstreams = [Upstream(service_name, url) for url in base_urls]
+        self.health_path = _service_setting(service_name, "HEALTH_PATH", HEALTH_CHECK_PATH)
+        self.latencies: deque = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    def record_latency(self, seconds: float) -> None:
+        """
+        Record the time an instance took to answer.
+        Args:
+            seconds: Time until response headers were received
+        """
+        self.latencies.append(seconds)
+
+    def latency_p95(self) -> Optional[float]:
+        """
+        Estimate the service's p95 latency from recent samples.
+        Returns:
+            p95 in seconds, or None until enough samples were collected
+        """
+        if len(self.latencies) < LATENCY_MIN_SAMPLES:
+            return None
+        samples = sorted(self.latencies)
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def choose(self, exclude: Sequence[Upstream] = ()) -> Optional[Upstream]:
+        """
+        Pick an instance using power-of-two-choices on outstanding requests.
+        Args:
+            exclude: Instances that must not be picked
+        Returns:
+            The chosen instance, or None if none is available
+        """
+        candidates = [u for u in self.upstreams if u not in exclude and u.available()]
+        if len(candidates) > 2:
+            candidates = random.sample(candidates, 2)
+        return min(candidates, key=lambda u: u.outstanding, default=None)
+
+    async def probe(self, upstream: Upstream) -> None:
+        """
+        Probe an instance's health endpoint and update its health flag.
+        Args:
+            upstream: Instance to probe
+        """
+        try:
+            response = await upstream.client.get(self.health_path, timeout=HEALTH_CHECK_TIMEOUT)
+            healthy = response.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != upstream.healthy:
+            logger.warning(f"Upstream {upstream.base_url} is now {'healthy' if healthy else 'unhealthy'}")
+        upstream.healthy = healthy
+
+    async def health_loop(self) -> None:
+        """Probe every instance in the background until cancelled."""
+        while True:
+            await asyncio.gather(*(self.probe(upstream) for upstream in self.upstreams))
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    def start(self) -> None:
+        """Start background health probing."""
+        self._health_task = asyncio.create_task(self.health_loop())
+
+    async def close(self) -> None:
+        """Stop health probing and close every instance client."""
+        if self._health_task:
+            self._health_task.cancel()
+        for upstream in self.upstreams:
+            await upstream.client.aclose()
+
+    def stats(self) -> Dict[str, object]:
+        """Return the state of every instance and the hedging counters."""
+        return {
+            "instances": [upstream.stats() for upstream in self.upstreams],
+            "latency_p95": self.latency_p95(),
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+        }
+
+
+# Shared pool per service, populated on application startup
+pools: Dict[str, UpstreamPool] = {}
+
+
+def parse_urls(urls: Optional[str]) -> List[str]:
+    """
+    Split a comma separated upstream list.
+    Args:
+        urls: Comma separated base URLs
+    Returns:
+        List of base URLs
+    """
+    return [url.strip() for url in (urls or "").split(",") if url.strip()]
+
+
+async def start_clients(services: Dict[str, List[str]]) -> None:
+    """
+    Create the upstream pool for every configured service.
+    Args:
+        services: Mapping of service name to its upstream base URLs
+    """
+    for service_name, base_urls in services.items():
+        if not base_urls:
+            logger.warning(f"No URL configured for service {service_name}")
+            continue
+        pools[service_name] = UpstreamPool(service_name, base_urls)
+        pools[service_name].start()
+        logger.info(f"Upstream pool ready for {service_name}: {base_urls}")
+
+
+async def close_clients() -> None:
+    """Close every upstream pool and release pooled connections."""
+    for service_name, pool in list(pools.items()):
+        await pool.close()
+        logger.info(f"Upstream pool closed for {service_name}")
+    pools.clear()
+
+
+def get_pool(service_name: str) -> Optional[UpstreamPool]:
+    """
+    Get the upstream pool for a service.
+    Args:
+        service_name: Name of the upstream service
+    Returns:
+        The pool or None if the service is unknown
+    """
+    return pools.get(service_name)
@@ -1,9 +1,31 @@
 import motor.motor_asyncio
+import logging
 import os
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
 MONGO_URI = os.getenv("MONGO_URI")
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
 database = client.adaptAiDatabase
 queries_collection = database.queries
+# Postprocessed responses written behind from the in-memory response store
+responses_collection = database.responses
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing the response lookups
+RESPONSE_INDEXES = [
+    IndexModel([("id", ASCENDING)], name="id"),
+    IndexModel([("session_id", ASCENDING), ("id", ASCENDING)], name="session_id"),
+]
+
+
+async def ensure_indexes() -> None:
+    """Create the `responses` indexes if they do not exist yet."""
+    try:
+        names = await responses_collection.create_indexes(RESPONSE_INDEXES)
+        logger.info(f"Indexes ready on responses: {names}")
+    except PyMongoError as e:
+        logger.error(f"Could not create indexes on responses: {e}")
 
 
 async def get_next_id():
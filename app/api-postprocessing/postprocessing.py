@@ -1,9 +1,29 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from mongodb import ensure_indexes
+from responsestore import response_store
+from pymongo.errors import PyMongoError
+import asyncio, logging
 import postprocessing_routes,uvicorn
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start persisting stored responses on startup, write the remaining ones on shutdown."""
+    await ensure_indexes()
+    persister = asyncio.create_task(response_store.run())
+    yield
+    persister.cancel()
+    try:
+        await response_store.flush(everything=True)
+    except PyMongoError as e:
+        logger.error(f"Lost {response_store.stats()['pending']} responses not persisted on shutdown: {e}")
+
 # Initialize the FastAPI app
-app = FastAPI(title="AdaptAI PostProcessing", version="1.0.0")
+app = FastAPI(title="AdaptAI PostProcessing", version="1.0.0", lifespan=lifespan)
 
 
 app.add_middleware(
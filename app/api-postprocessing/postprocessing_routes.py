@@ -1,9 +1,11 @@
-from fastapi import APIRouter,Request
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
+from typing import Any, Dict, List
 import logging, os
 import asyncio
 import websockets
-from schemas import AIQueryResponse
+from schemas import AIQueryResponse, PostProcessingResult
+from responsestore import response_store
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,8 +15,7 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/postprocessing", tags=["PostProcessing"])
 
-# in-memory AI response data
-responses = []
+SESSION_RESPONSES_LIMIT = int(os.getenv("SESSION_RESPONSES_LIMIT", "100"))
 
 @router.post("/", response_model=AIQueryResponse)
 async def request_post_processing(response: AIQueryResponse):
@@ -26,8 +27,90 @@ async def request_post_processing(response: AIQueryResponse):
         Processed query with validated results.\n
     """
     logger.info("Entered post processing POST request")
+    return await process_response(response)
+
+@router.post("/batch", response_model=List[PostProcessingResult])
+async def request_post_processing_batch(responses_batch: List[Dict[str, Any]]):
+    """
+    POST request post-processing on several AI responses in one call.\n
+    Responses of a session are processed in order and the first failure
+    skips the rest of that session, other sessions run concurrently.\n
+    Arguments:  \n
+        responses_batch: AI query responses that need to be post-processed. \n
+    Returns:  \n
+        One result per response, in request order.\n
+    """
+    logger.info(f"Entered post processing batch POST request with {len(responses_batch)} responses")
+    results: List[PostProcessingResult] = [None] * len(responses_batch)
+    sessions: Dict[str, List[int]] = {}
+    for index, item in enumerate(responses_batch):
+        sessions.setdefault(str(item.get("session_id")), []).append(index)
+
+    async def process_session(indexes: List[int]):
+        for position, index in enumerate(indexes):
+            try:
+                await process_response(AIQueryResponse.parse_obj(responses_batch[index]))
+                results[index] = PostProcessingResult(index=index, status_code=200)
+            except ValidationError as e:
+                results[index] = PostProcessingResult(index=index, status_code=422, error=str(e))
+            except Exception as e:
+                logger.error(f"Post processing failed for batch item {index}: {e}")
+                results[index] = PostProcessingResult(index=index, status_code=500, error=str(e))
+            if results[index].status_code != 200:
+                # Keep the session in order, its later responses are retried after this one
+                for skipped in indexes[position + 1:]:
+                    results[skipped] = PostProcessingResult(index=skipped, status_code=424,
+                                                            error=f"Previous response {index} of the session failed")
+                return
+
+    await asyncio.gather(*(process_session(indexes) for indexes in sessions.values()))
+    return results
+
+@router.get("/stats")
+def response_store_stats() -> Dict[str, Any]:
+    """
+    GET the size and memory usage of the response store.\n
+    Returns:  \n
+        Store counters.\n
+    """
+    return response_store.stats()
+
+@router.get("/session/{session_id}", response_model=List[AIQueryResponse])
+async def get_session_responses(session_id: str, limit: int = Query(SESSION_RESPONSES_LIMIT, ge=1, le=1000)):
+    """
+    GET the latest postprocessed responses of a session.\n
+    Arguments:  \n
+        session_id: Session of the responses. \n
+        limit: Maximum number of responses. \n
+    Returns:  \n
+        Responses of the session, newest first.\n
+    """
+    return await response_store.get_session(session_id, limit)
+
+@router.get("/{query_id}", response_model=AIQueryResponse)
+async def get_response(query_id: int):
+    """
+    GET the postprocessed response of a query.\n
+    Arguments:  \n
+        query_id: Id of the query. \n
+    Returns:  \n
+        The stored response.\n
+    """
+    response = await response_store.get(query_id)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Response not found")
+    return response
+
+async def process_response(response: AIQueryResponse) -> AIQueryResponse:
+    """
+    Store a response and get it verified when needed.\n
+    Arguments:  \n
+        response: AI query response that needs to be post-processed. \n
+    Returns:  \n
+        Processed query with validated results.\n
+    """
     response_dict = response.dict()
-    responses.append(response_dict)
+    response_store.add(response_dict)
     if response.metadata.needs_verification :
         await websocket_client()
     return AIQueryResponse(**response_dict)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import resource
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from pymongo import DESCENDING, InsertOne, UpdateOne
+from pymongo.errors import PyMongoError
+
+from common.jsonencoder import dumps
+from mongodb import responses_collection
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_STORE_SIZE = int(os.getenv("RESPONSE_STORE_SIZE", "10000"))
+RESPONSE_STORE_MAX_AGE = float(os.getenv("RESPONSE_STORE_MAX_AGE", "300"))  # seconds
+# Evicted responses waiting to be written, the oldest are dropped beyond this
+RESPONSE_STORE_PENDING_LIMIT = int(os.getenv("RESPONSE_STORE_PENDING_LIMIT", "10000"))
+RESPONSE_STORE_FLUSH_INTERVAL = float(os.getenv("RESPONSE_STORE_FLUSH_INTERVAL", "5"))  # seconds
+RESPONSE_STORE_FLUSH_BATCH = int(os.getenv("RESPONSE_STORE_FLUSH_BATCH", "500"))
+
+
+@dataclass
+class StoredResponse:
+    """Postprocessed response held in memory."""
+    seq: int
+    stored_at: float
+    size: int  # Serialized size, used to report memory usage
+    response: Dict[str, Any]
+
+
+class ResponseStore:
+    """
+    Bounded in-memory store of postprocessed responses.
+
+    Responses are kept in insertion order and indexed by query `id` and
+    `session_id`. Once the store is full, or a response is older than
+    `max_age`, it moves to a pending buffer written to MongoDB in batches
+    by `run()`. Lookups check memory first and fall back to MongoDB.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_STORE_SIZE, max_age: float = RESPONSE_STORE_MAX_AGE,
+                 pending_limit: int = RESPONSE_STORE_PENDING_LIMIT):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.pending_limit = pending_limit
+        self.evictions = 0
+        self.persisted = 0
+        self.dropped = 0
+        self.hits = 0
+        self.misses = 0
+        self._seq = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[int, StoredResponse]" = OrderedDict()
+        self._pending: "OrderedDict[int, StoredResponse]" = OrderedDict()
+        # Both indexes cover buffered and pending responses
+        self._by_id: Dict[int, int] = {}
+        self._by_session: Dict[str, Dict[int, None]] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, response: Dict[str, Any]) -> None:
+        """
+        Store a postprocessed response, moving the oldest ones to the write-behind buffer.
+        Args:
+            response: AI query response as a dict
+        """
+        previous = self._by_id.get(response.get("id"))
+        if previous is not None:
+            # A redelivered response replaces the stored one
+            self._discard(self._entries.pop(previous, None) or self._pending.pop(previous))
+
+        self._seq += 1
+        entry = StoredResponse(self._seq, time.time(), len(dumps(response)), response)
+        self._entries[entry.seq] = entry
+        self._bytes += entry.size
+        if response.get("id") is not None:
+            self._by_id[response["id"]] = entry.seq
+        self._by_session.setdefault(str(response.get("session_id")), {})[entry.seq] = None
+
+        while len(self._entries) > self.maxsize:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Move the oldest buffered response to the write-behind buffer."""
+        _, entry = self._entries.popitem(last=False)
+        self._pending[entry.seq] = entry
+        self.evictions += 1
+        while len(self._pending) > self.pending_limit:
+            # MongoDB is not keeping up, memory stays bounded at the cost of the oldest responses
+            _, dropped = self._pending.popitem(last=False)
+            self._discard(dropped)
+            self.dropped += 1
+            logger.warning(f"Dropped response {dropped.response.get('id')} waiting to be persisted")
+
+    def _discard(self, entry: StoredResponse) -> None:
+        """Remove a response that left memory from the indexes."""
+        self._bytes -= entry.size
+        if self._by_id.get(entry.response.get("id")) == entry.seq:
+            del self._by_id[entry.response["id"]]
+        session_key = str(entry.response.get("session_id"))
+        session = self._by_session.get(session_key)
+        if session is not None:
+            session.pop(entry.seq, None)
+            if not session:
+                del self._by_session[session_key]
+
+    def _entry(self, seq: int) -> StoredResponse:
+        """Buffered or pending response by sequence number."""
+        return self._entries.get(seq) or self._pending[seq]
+
+    async def get(self, query_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up the response of a query.
+        Args:
+            query_id: Query `id`
+        Returns:
+            The response, or None if it was never stored
+        """
+        seq = self._by_id.get(query_id)
+        if seq is not None:
+            self.hits += 1
+            return self._entry(seq).response
+        self.misses += 1
+        return await responses_collection.find_one({"id": query_id}, {"_id": 0})
+
+    async def get_session(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Look up the latest responses of a session.
+        Args:
+            session_id: Session identifier
+            limit: Maximum number of responses
+        Returns:
+            Up to `limit` responses, newest first
+        """
+        seqs = list(self._by_session.get(session_id, {}))[::-1][:limit]
+        found = [self._entry(seq).response for seq in seqs]
+        if len(found) < limit:
+            # Older responses of the session were already written to MongoDB
+            in_memory = [response["id"] for response in found if response.get("id") is not None]
+            cursor = responses_collection.find({"session_id": session_id, "id": {"$nin": in_memory}}, {"_id": 0})
+            found.extend(await cursor.sort("id", DESCENDING).limit(limit - len(found)).to_list(None))
+        return found
+
+    def expire(self) -> None:
+        """Move responses older than `max_age` to the write-behind buffer."""
+        cutoff = time.time() - self.max_age
+        while self._entries and next(iter(self._entries.values())).stored_at <= cutoff:
+            self._evict()
+
+    async def flush(self, everything: bool = False) -> None:
+        """
+        Write pending responses to MongoDB in batches.
+        Args:
+            everything: Also write the buffered responses, used on shutdown
+        """
+        async with self._flush_lock:
+            if everything:
+                while self._entries:
+                    self._evict()
+            while self._pending:
+                batch = list(self._pending.values())[:RESPONSE_STORE_FLUSH_BATCH]
+                requests = [
+                    UpdateOne({"id": entry.response["id"]}, {"$set": entry.response}, upsert=True)
+                    if entry.response.get("id") is not None else InsertOne(dict(entry.response))
+                    for entry in batch
+                ]
+                await responses_collection.bulk_write(requests, ordered=False)
+                for entry in batch:
+                    # Replaced while being written, the newer response is already tracked
+                    if self._pending.pop(entry.seq, None) is not None:
+                        self._discard(entry)
+                self.persisted += len(batch)
+
+    async def run(self) -> None:
+        """Expire and persist responses in the background until cancelled."""
+        while True:
+            await asyncio.sleep(RESPONSE_STORE_FLUSH_INTERVAL)
+            self.expire()
+            try:
+                await self.flush()
+            except PyMongoError as e:
+                # Pending responses stay in memory and are retried on the next round
+                logger.error(f"Could not persist responses: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return store counters and memory usage for sizing."""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "pending": len(self._pending),
+            "pending_limit": self.pending_limit,
+            "sessions": len(self._by_session),
+            "payload_bytes": self._bytes,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "persisted": self.persisted,
+            "dropped": self.dropped,
+        }
+
+
+response_store = ResponseStore()
@@ -108,3 +108,9 @@ class QueryResult(Query):
 #Input to postprocessing service
 class AIQueryResponse(Query):
     result: AIResponse
+
+#Outcome of a single response in a postprocessing batch
+class PostProcessingResult(BaseModel):
+    index: int
+    status_code: int
+    error: Optional[str] = None
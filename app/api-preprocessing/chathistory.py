@@ -0,0 +1,162 @@
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from common.jsonencoder import dumps, dumps_str
+from common.rediscache import redis_client, DEFAULT_CACHE_TTL
+from schemas import ChatData
+
+logger = logging.getLogger(__name__)
+
+# Chat history expires this long after the last message
+CHAT_HISTORY_TTL = int(os.getenv("CHAT_HISTORY_TTL", str(DEFAULT_CACHE_TTL)))
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "100"))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "1000"))
+DEFAULT_APP_ID = "default_app"
+METADATA_FIELDS = ("created_at", "last_updated_at", "app_id", "version")
+
+
+def messages_key(user_id: str, session_id: str) -> str:
+    """Redis list holding one compact record per chat message."""
+    return f"chathistory:{user_id}:{session_id}:messages"
+
+
+def meta_key(user_id: str, session_id: str) -> str:
+    """Redis hash holding the chat history metadata and version."""
+    return f"chathistory:{user_id}:{session_id}:meta"
+
+
+def encode_message(message: ChatData) -> bytes:
+    """
+    Encode a chat message as a compact JSON record.
+    Args:
+        message: Chat message to encode
+    Returns:
+        Compact JSON record
+    """
+    return dumps(message.dict())
+
+
+def queue_append(pipe, user_id: str, session_id: str, app_id: str, messages: List[ChatData]) -> None:
+    """
+    Queue an O(1) append of messages on a Redis pipeline.
+    Args:
+        pipe: Redis pipeline to add the commands to
+        user_id: User identifier
+        session_id: Session identifier
+        app_id: Client app for which the conversation is held
+        messages: Messages to append in order
+    """
+    now = datetime.now().isoformat()
+    messages_cache_key = messages_key(user_id, session_id)
+    meta_cache_key = meta_key(user_id, session_id)
+    pipe.rpush(messages_cache_key, *(encode_message(message) for message in messages))
+    pipe.hsetnx(meta_cache_key, "created_at", now)
+    pipe.hsetnx(meta_cache_key, "app_id", app_id)
+    pipe.hset(meta_cache_key, "last_updated_at", now)
+    pipe.hincrby(meta_cache_key, "version", 1)
+    pipe.expire(messages_cache_key, CHAT_HISTORY_TTL)
+    pipe.expire(meta_cache_key, CHAT_HISTORY_TTL)
+
+
+async def get_metadata(user_id: str, session_id: str) -> Dict[str, Optional[str]]:
+    """
+    Read the chat history metadata without loading any message.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+    Returns:
+        Metadata fields, empty values when no history exists or on error
+    """
+    try:
+        values = await redis_client.hmget(meta_key(user_id, session_id), *METADATA_FIELDS)
+    except RedisError as e:
+        logger.error(f"Redis error when retrieving chat history metadata: {e}")
+        values = [None] * len(METADATA_FIELDS)
+    return dict(zip(METADATA_FIELDS, values))
+
+
+def page_etag(metadata: Dict[str, Optional[str]], cursor: Optional[int], limit: int) -> Optional[str]:
+    """
+    Build the ETag of a history page from the history version.
+    Args:
+        metadata: Chat history metadata
+        cursor: Requested start index, None for the tail
+        limit: Page size
+    Returns:
+        Quoted ETag, or None when no history exists
+    """
+    if not metadata["version"]:
+        return None
+    created = datetime.fromisoformat(metadata["created_at"]).timestamp()
+    start = "tail" if cursor is None else cursor
+    return f'"{created:.6f}-{metadata["version"]}-{start}-{limit}"'
+
+
+async def get_page(user_id: str,
+                   session_id: str,
+                   cursor: Optional[int],
+                   limit: int) -> Tuple[Dict[str, Optional[str]], List[str], int, int]:
+    """
+    Read one page of chat history in a single round trip.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        cursor: Index of the first message to return, None for the last `limit` messages
+        limit: Maximum number of messages to return
+    Returns:
+        Tuple of (metadata, encoded messages, start index, total messages), an empty history on error
+    """
+    if cursor is None:
+        start, end = -limit, -1
+    else:
+        start, end = cursor, cursor + limit - 1
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hmget(meta_key(user_id, session_id), *METADATA_FIELDS)
+            pipe.llen(messages_key(user_id, session_id))
+            pipe.lrange(messages_key(user_id, session_id), start, end)
+            values, total, records = await pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error when retrieving chat history: {e}")
+        values, total, records = [None] * len(METADATA_FIELDS), 0, []
+    metadata = dict(zip(METADATA_FIELDS, values))
+    first = max(0, total - limit) if cursor is None else cursor
+    return metadata, records, first, total
+
+
+def render_page(user_id: str,
+                session_id: str,
+                metadata: Dict[str, Optional[str]],
+                records: List[str],
+                start: int,
+                total: int) -> str:
+    """
+    Render a history page as JSON, splicing the stored records in unchanged.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        metadata: Chat history metadata
+        records: Encoded messages of the page
+        start: Index of the first message in the page
+        total: Total number of messages in the history
+    Returns:
+        JSON document compatible with `ChatHistory`, plus cursor fields
+    """
+    now = datetime.now().isoformat()
+    header = dumps_str({
+        "user_id": user_id,
+        "session_id": session_id,
+        "metadata": {
+            "created_at": metadata["created_at"] or now,
+            "last_updated_at": metadata["last_updated_at"] or now,
+            "app_id": metadata["app_id"] or DEFAULT_APP_ID,
+        },
+        "cursor": start,
+        "next_cursor": start + len(records),
+        "total": total,
+    })
+    return f'{header[:-1]},"messages":[{",".join(records)}]}}'
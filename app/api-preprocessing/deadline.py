@@ -0,0 +1,86 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+import pymongo
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+# Absolute deadline in Unix epoch milliseconds, set by the API gateway
+DEADLINE_HEADER = "x-request-deadline"
+
+T = TypeVar("T")
+
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    Seconds left before the current request's deadline.
+    Returns:
+        Remaining seconds, or None if the request has no deadline
+    """
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def mongo_timeout():
+    """
+    Bound every Mongo operation in the block by the request deadline.
+    Returns:
+        A `pymongo.timeout` context manager, unbounded without a deadline
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    return pymongo.timeout(remaining)
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """
+    Await a Redis (or other) call without running past the request deadline.
+    Args:
+        awaitable: Call to bound
+    Returns:
+        The call's result
+    Raises:
+        HTTPException: 504 once the deadline has passed
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return await awaitable
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+
+
+async def deadline_middleware(request: Request, call_next):
+    """
+    Read the propagated deadline and reject requests that already expired.
+    Args:
+        request: Incoming request
+        call_next: Next handler in the chain
+    Returns:
+        The handler's response, or 504 if the deadline has passed
+    """
+    header = request.headers.get(DEADLINE_HEADER)
+    try:
+        deadline = float(header) / 1000 if header else None
+    except ValueError:
+        deadline = None
+    if deadline is not None and deadline <= time.time():
+        return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+
+    token = request_deadline.set(deadline)
+    try:
+        return await call_next(request)
+    finally:
+        request_deadline.reset(token)
@@ -0,0 +1,29 @@
+import os
+from common.streamcodec import encode_event, partition_for, partition_stream, partition_streams
+from schemas import AIQueryResponse
+
+PREPROCESS_STREAM = "preprocess_request"
+# Hard bound on the stream length, enforced approximately on every XADD
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "100000"))
+# Sessions are spread over this many streams, each consumed in order by one listener
+STREAM_PARTITIONS = int(os.getenv("STREAM_PARTITIONS", "1"))
+PREPROCESS_STREAMS = partition_streams(PREPROCESS_STREAM, STREAM_PARTITIONS)
+
+
+def session_stream(session_id: str) -> str:
+    """Partition stream holding the events of a session"""
+    partition = partition_for(session_id or "", STREAM_PARTITIONS)
+    return partition_stream(PREPROCESS_STREAM, partition, STREAM_PARTITIONS)
+
+
+def event_data(ai_query_response: AIQueryResponse) -> dict:
+    """Encode the response in the versioned stream wire format"""
+    return encode_event(ai_query_response.dict())
+
+
+def queue_event(pipe, ai_query_response: AIQueryResponse) -> None:
+    """Queues a redis stream event on a pipeline"""
+    # id as '*' to have an autogenerated id
+    pipe.xadd(session_stream(ai_query_response.session_id), event_data(ai_query_response), "*",
+              maxlen=STREAM_MAXLEN, approximate=True)
+
@@ -1,24 +1,103 @@
 import motor.motor_asyncio
+import asyncio
+import logging
 import os
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from typing import List
 MONGO_URI = os.getenv("MONGO_URI")
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
 database = client.adaptAiDatabase
 queries_collection = database.queries
 test_va_context = database.test_va_context
 
+logger = logging.getLogger(__name__)
+
+# Number of query ids reserved from the shared counter per round trip
+QUERY_ID_BLOCK_SIZE = int(os.getenv("QUERY_ID_BLOCK_SIZE", "1000"))
+
+
+class IdBlockAllocator:
+    """
+    Hi-lo allocator handing out `id` values from blocks reserved in MongoDB.
+
+    Each worker process atomically reserves `block_size` ids with a single
+    `$inc` on the shared counter and hands them out locally, so ids stay
+    unique across replicas. Ids left in a block when a worker stops are
+    never reused, which leaves gaps in the sequence.
+    """
+
+    def __init__(self, counter_id: str = "query_id", block_size: int = QUERY_ID_BLOCK_SIZE):
+        self.counter_id = counter_id
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0  # Exclusive upper bound of the current block
+        self._lock = asyncio.Lock()
+
+    async def _reserve(self, size: int) -> None:
+        """Reserve the next `size` ids from the shared counter."""
+        counter = await queries_collection.database.counters.find_one_and_update(
+            {"_id": self.counter_id},
+            {"$inc": {"seq": size}},  #  Reserve a whole block at once
+            return_document=True,
+            upsert=True  #  Create document if it doesn't exist
+        )
+        self._end = counter["seq"] + 1
+        self._next = self._end - size
+
+    async def next_ids(self, count: int = 1) -> List[int]:
+        """
+        Allocate `count` unique ids.
+        Args:
+            count: Number of ids needed
+        Returns:
+            The allocated ids in increasing order
+        """
+        async with self._lock:
+            ids: List[int] = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    await self._reserve(max(self.block_size, count - len(ids)))
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+            return ids
+
+
+query_id_allocator = IdBlockAllocator()
+
 
 async def get_next_id():
-    """Fetch the next sequence number for `id` from MongoDB counters."""
+    """Fetch the next `id` from this worker's reserved block."""
+    ids = await query_id_allocator.next_ids(1)
+    return ids[0]
+
+
+# Indexes backing every lookup made by the preprocessing routes
+QUERY_INDEXES = [
+    # Session listing with keyset pagination on `id`
+    IndexModel([("user_id", ASCENDING), ("session_id", ASCENDING), ("id", ASCENDING)], name="user_session_id"),
+    # Single query lookup, also guards against duplicate ids
+    IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+]
 
-    counter = await queries_collection.database.counters.find_one_and_update(
-        {"_id": "query_id"},
-        {"$inc": {"seq": 1}},  #  Increment `seq` by 1
-        return_document=True,
-        upsert=True  #  Create document if it doesn't exist
-    )
+# Representative filter and sort of each route, tests/test_query_plans.py asserts none of them scans the collection
+ROUTE_QUERIES = {
+    "get_queries": ({"user_id": "", "session_id": "", "id": {"$gt": 0}}, [("id", ASCENDING)]),
+    "get_queries_filtered": ({"user_id": "", "session_id": "", "metadata.app_id": ""}, [("id", ASCENDING)]),
+    "load_query_list": ({"user_id": "", "session_id": ""}, [("id", ASCENDING)]),
+    "create_queries_check": ({"id": {"$in": [0, 1]}}, None),
+    "get_query": ({"id": 0}, None),
+}
 
-    if counter is None:  #  If document doesn't exist, create it manually
-        await queries_collection.database.counters.insert_one({"_id": "query_id", "seq": 1})
-        return 1  #  First ID starts at 1
 
-    return counter["seq"]  # Always return a valid `seq`
+async def ensure_indexes() -> None:
+    """Create the `queries` indexes if they do not exist yet, each one independently."""
+    for index in QUERY_INDEXES:
+        name = index.document["name"]
+        try:
+            await queries_collection.create_indexes([index])
+            logger.info(f"Index {name} ready on queries")
+        except PyMongoError as e:
+            # Existing duplicate ids make the unique index fail, the other indexes are still built
+            logger.error(f"Could not create index {name} on queries: {e}")
@@ -1,9 +1,31 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from common.rediscache import close_redis, redis_round_trips, RoundTripCounter
+from deadline import deadline_middleware
+from mongodb import ensure_indexes
+from streamcontrol import stream_monitor
 import preprocessing_routes
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Report the number of Redis round trips made by each request
+TRACE_REDIS_ROUND_TRIPS = os.getenv("TRACE_REDIS_ROUND_TRIPS", "false").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the MongoDB indexes and start stream monitoring on startup, release resources on shutdown."""
+    await ensure_indexes()
+    stream_monitor.start()
+    yield
+    await stream_monitor.close()
+    await close_redis()
 
 # Initialize the FastAPI app
-app = FastAPI(title="AdaptAI API", version="1.0.0")
+app = FastAPI(title="AdaptAI API", version="1.0.0", lifespan=lifespan)
 
 if __name__ == "__main__":
     import uvicorn
@@ -16,5 +38,29 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Honor the request deadline propagated by the API gateway
+app.middleware("http")(deadline_middleware)
+
+async def redis_round_trip_middleware(request: Request, call_next):
+    """Count the Redis round trips of a request and return them in `X-Redis-Round-Trips`."""
+    counter = RoundTripCounter()
+    token = redis_round_trips.set(counter)
+    try:
+        response = await call_next(request)
+    finally:
+        redis_round_trips.reset(token)
+    response.headers["X-Redis-Round-Trips"] = str(counter.count)
+    logger.info(f"{request.method} {request.url.path} made {counter.count} Redis round trips")
+    return response
+
+if TRACE_REDIS_ROUND_TRIPS:
+    app.middleware("http")(redis_round_trip_middleware)
+
 # Include the example routes
-app.include_router(preprocessing_routes.router)
\ No newline at end of file
+app.include_router(preprocessing_routes.router)
+
+
+@app.get("/health")
+async def health_check():
+    """Health endpoint probed by the API gateway."""
+    return {"status": "healthy", "message": "Preprocessing API is running"}
\ No newline at end of file
@@ -1,12 +1,18 @@
-from fastapi import APIRouter,Request, HTTPException
-from fastapi.background import BackgroundTasks
-from pymongo.errors import DuplicateKeyError, PyMongoError
-from mongodb import queries_collection,get_next_id
-from rediscache import get_redis_cache, set_redis_cache, delete_redis_cache,send_event
-from schemas import Query,AIQueryResponse,AIResponse
-from schemas import QueryMetadata,ChatHistory,ChatData,ChatMetadata,UserRole
-from typing import List
-import traceback, logging, httpx, json
+from fastapi import APIRouter,Request, HTTPException, Response, Depends
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from redis.exceptions import RedisError
+from mongodb import queries_collection,get_next_id,query_id_allocator
+from common.rediscache import redis_client
+from common.jsonencoder import dumps
+import chathistory
+import querycache
+from events import queue_event
+from streamcontrol import enforce_backpressure
+from deadline import within_deadline, mongo_timeout
+from schemas import Query,AIQueryResponse,AIResponse,QueryBatchResult
+from schemas import QueryMetadata,ChatData,UserRole
+from typing import List, Optional
+import traceback, logging, httpx, os
 from datetime import datetime
 from enum import Enum
 
@@ -18,23 +24,137 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/queries", tags=["Queries"])
 
+# Query documents are cached and returned without Mongo's internal `_id`
+QUERY_PROJECTION = {"_id": 0}
+# Default and maximum number of queries returned per page
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "100"))
+QUERY_MAX_PAGE_SIZE = int(os.getenv("QUERY_MAX_PAGE_SIZE", "1000"))
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Maximum number of queries accepted by POST /queries/batch
+QUERY_BATCH_LIMIT = int(os.getenv("QUERY_BATCH_LIMIT", "500"))
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Check an `If-None-Match` request header against the current ETag."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+def page_response(body: str, etag: Optional[str], next_cursor) -> Response:
+    """Wrap a page of queries, exposing the next cursor as a header."""
+    headers = {}
+    if etag:
+        headers["ETag"] = etag
+    if next_cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def build_ai_query_response(query_dict: dict, ai_response: AIResponse) -> AIQueryResponse:
+    """Build the stream event published for a stored query."""
+    metadata = QueryMetadata(
+        timestamp=query_dict["metadata"]["timestamp"],
+        app_id=query_dict["metadata"]["app_id"],
+        needs_verification=query_dict["metadata"]["needs_verification"]
+    )
+    return AIQueryResponse(
+        id=query_dict.get("id"),
+        user_id=query_dict.get("user_id"),
+        session_id=query_dict.get("session_id"),
+        usercommand=query_dict["usercommand"],
+        metadata=metadata,
+        result=ai_response
+    )
+
+def build_chat_messages(query_dict: dict, ai_response: AIResponse) -> List[ChatData]:
+    """Build both sides of the exchange appended to the chat history."""
+    user_chat = ChatData(
+        id=query_dict["id"],
+        timestamp=query_dict["metadata"]["timestamp"],
+        role= UserRole.User,
+        usercommand=query_dict["usercommand"]
+    )
+    assistant_chat = ChatData(
+        id=query_dict["id"],
+        timestamp=datetime.now().isoformat(),
+        role= UserRole.Assistant,
+        usercommand=ai_response.response
+    )
+    return [user_chat, assistant_chat]
+
+async def update_redis(query_dicts: List[dict], user_id: str, session_id: str, ai_response: AIResponse) -> None:
+    """
+    Apply every Redis write for newly stored queries in one transactional round trip:
+    append them to the cached session list, invalidate the cached filtered pages,
+    append the chat history and publish the stream events.
+    """
+    messages = [message for query_dict in query_dicts for message in build_chat_messages(query_dict, ai_response)]
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            querycache.queue_append(pipe, user_id, session_id, query_dicts)
+            querycache.queue_bump_version(pipe, user_id, session_id)
+            chathistory.queue_append(pipe, user_id, session_id, query_dicts[0]["metadata"]["app_id"], messages)
+            for query_dict in query_dicts:
+                queue_event(pipe, build_ai_query_response(query_dict, ai_response))
+            await pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error when updating caches for {len(query_dicts)} queries: {e}")
+
+async def load_query_list(user_id: str,
+                          session_id: str,
+                          version: str,
+                          after: Optional[int],
+                          limit: int):
+    """
+    Rebuild the cached session list from Mongo and serve an unfiltered page from it.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        version: Session version read before loading, the list is only cached if it is unchanged
+        after: Return queries with an id greater than this cursor
+        limit: Maximum number of queries to return
+    Returns:
+        Tuple of (encoded queries, next cursor), queries is None when the session is too large to cache
+    """
+    try:
+        with mongo_timeout():
+            # One extra document tells whether the session fits in the list
+            queries_db = await queries_collection.find({"user_id": user_id, "session_id": session_id},
+                                                       QUERY_PROJECTION) \
+                .sort("id", 1).limit(querycache.QUERY_LIST_MAX_SIZE + 1).to_list(querycache.QUERY_LIST_MAX_SIZE + 1)
+    except PyMongoError as e:
+        raise HTTPException(status_code=504 if e.timeout else 500, detail=f"MongoDB error: {str(e)}")
+    if len(queries_db) > querycache.QUERY_LIST_MAX_SIZE:
+        return None, None
 
-def serialize_for_json(obj):
-    """Helper function to serialize objects that aren't JSON serializable by default"""
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    if isinstance(obj, UserRole):
-        return obj.value
-    raise TypeError(f"Type {type(obj)} not serializable")
+    await within_deadline(querycache.fill_list(user_id, session_id, version, queries_db))
+    page = [query for query in queries_db if after is None or query["id"] > after][:limit + 1]
+    next_cursor = page[limit - 1]["id"] if len(page) > limit else None
+    return [querycache.encode_query(query) for query in page[:limit]], next_cursor
 
 @router.get("/", response_model=List[Query])
-async def get_queries(request: Request):
+async def get_queries(request: Request,
+                      limit: int = QUERY_PAGE_SIZE,
+                      after: Optional[int] = None,
+                      app_id: Optional[str] = None,
+                      needs_verification: Optional[bool] = None,
+                      since: Optional[datetime] = None,
+                      until: Optional[datetime] = None):
     """
-    GET fetches all queries for a specific user session.\n
+    GET fetches a page of queries for a specific user session.\n
     Arguments:  \n
         request: Client request for preprocessing. \n
+        limit: Maximum number of queries to return. \n
+        after: Return queries with an id greater than this cursor. \n
+        app_id: Only return queries made for this client app. \n
+        needs_verification: Only return queries with this verification flag. \n
+        since: Only return queries made at or after this time. \n
+        until: Only return queries made before this time. \n
     Returns:  \n
-        All the queries for this user.\n
+        The queries of the page, ordered by id. The cursor of the next page
+        is returned in the `X-Next-Cursor` header.\n
     """
     user_id = request.headers.get("user-id")
     session_id = request.headers.get("session-id")
@@ -42,30 +162,73 @@ async def get_queries(request: Request):
     logger.info(f"User {user_id} session {session_id}")
     if not user_id or not session_id:
         raise HTTPException(status_code=401, detail="Unauthorized: Missing session data")
+    if not 0 < limit <= QUERY_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {QUERY_MAX_PAGE_SIZE}")
+
+    #  Every page is cached under the session's current version
+    params = {"limit": limit, "after": after, "app_id": app_id, "needs_verification": needs_verification,
+              "since": since.isoformat() if since else None, "until": until.isoformat() if until else None}
+    unfiltered = app_id is None and needs_verification is None and since is None and until is None
+    version = await within_deadline(querycache.get_version(user_id, session_id))
+    etag = querycache.page_etag(version, params) if version else None
+    if etag:
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        if unfiltered:
+            # New queries are appended to the session list, so unfiltered pages never go stale
+            records, next_cursor = await within_deadline(querycache.get_list_page(user_id, session_id, after, limit))
+            if records is None:
+                records, next_cursor = await load_query_list(user_id, session_id, version, after, limit)
+            if records is not None:
+                return page_response(f'[{",".join(records)}]', etag, next_cursor)
+        body, next_cursor = await within_deadline(querycache.get_page(user_id, session_id, etag))
+        if body is not None:
+            logger.info("Returning cached data")
+            return page_response(body, etag, next_cursor)
+
+    # Keyset pagination on (user_id, session_id, id)
+    query_filter = {"user_id": user_id, "session_id": session_id}
+    if after is not None:
+        query_filter["id"] = {"$gt": after}
+    if app_id is not None:
+        query_filter["metadata.app_id"] = app_id
+    if needs_verification is not None:
+        query_filter["metadata.needs_verification"] = needs_verification
+    if since or until:
+        # Timestamps are stored as ISO strings, which sort chronologically
+        query_filter["metadata.timestamp"] = {}
+        if since:
+            query_filter["metadata.timestamp"]["$gte"] = since.isoformat()
+        if until:
+            query_filter["metadata.timestamp"]["$lt"] = until.isoformat()
 
-    #  Check if data exists in Redis cache
-    cache_key = f"querycache:{user_id}:{session_id}"
-    cached_data = await get_redis_cache(cache_key)
-    if cached_data:
-        logger.info("Returning cached data")
-        return json.loads(cached_data)  # Return cached data
-
-    # If not cached, fetch from MongoDB
-    queries_db = await queries_collection.find({"user_id": user_id,"session_id": session_id}).to_list(100)
+    try:
+        with mongo_timeout():
+            # One extra document tells whether a next page exists
+            queries_db = await queries_collection.find(query_filter, QUERY_PROJECTION) \
+                .sort("id", 1).limit(limit + 1).to_list(limit + 1)
+    except PyMongoError as e:
+        raise HTTPException(status_code=504 if e.timeout else 500, detail=f"MongoDB error: {str(e)}")
 
-    await set_redis_cache(cache_key,queries_db)
-    logger.info(f"After setting redis cache")
+    next_cursor = queries_db[limit - 1]["id"] if len(queries_db) > limit else None
+    body = dumps(queries_db[:limit])
+    if etag:
+        await within_deadline(querycache.set_page(user_id, session_id, etag, body, next_cursor))
 
-    return queries_db
+    return page_response(body, etag, next_cursor)
 
 @router.get("/chathistory", response_model=None)
-async def get_chat_history(request: Request):
+async def get_chat_history(request: Request,
+                           cursor: Optional[int] = None,
+                           limit: int = chathistory.CHAT_HISTORY_PAGE_SIZE):
     """
-    GET fetches all queries for a specific user session.\n
+    GET fetches a page of the chat history for a specific user session.\n
     Arguments:  \n
         request: Client request for preprocessing. \n
+        cursor: Index of the first message to return, the latest messages when omitted. \n
+        limit: Maximum number of messages to return. \n
     Returns:  \n
-        All the queries for this user.\n
+        The chat history page with `cursor`, `next_cursor` and `total`.\n
     """
     user_id = request.headers.get("user-id")
     session_id = request.headers.get("session-id")
@@ -73,41 +236,99 @@ async def get_chat_history(request: Request):
     logger.info(f"User {user_id} session {session_id}")
     if not user_id or not session_id:
         raise HTTPException(status_code=401, detail="Unauthorized: Missing session data")
+    if (cursor is not None and cursor < 0) or not 0 < limit <= chathistory.CHAT_HISTORY_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail="Invalid cursor or limit")
+
+    # Only the metadata is read to answer a conditional request
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        metadata = await within_deadline(chathistory.get_metadata(user_id, session_id))
+        etag = chathistory.page_etag(metadata, cursor, limit)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+    metadata, records, start, total = await within_deadline(
+        chathistory.get_page(user_id, session_id, cursor, limit))
+    etag = chathistory.page_etag(metadata, cursor, limit)
+    logger.info("Returning chat history data")
+    return Response(content=chathistory.render_page(user_id, session_id, metadata, records, start, total),
+                    media_type="application/json", headers={"ETag": etag} if etag else None)
+
+# POST several queries at once
+@router.post("/batch", response_model=List[QueryBatchResult], dependencies=[Depends(enforce_backpressure)])
+async def create_queries(queries: List[Query], request: Request):
+    """
+        POST Creates several query requests in one call, e.g. when replaying an offline conversation.\n
+        Arguments:  \n
+            queries: The queries requested, in conversation order. \n
+        Returns:  \n
+            One result per query, in request order, reporting its id or the reason it failed.
+            When MongoDB fails mid-batch and the written queries cannot be determined, every
+            result is `indeterminate` and the client should list the session before retrying.\n
+        """
+    user_id = request.headers.get("user-id")
+    session_id = request.headers.get("session-id")
 
-    #  Check if data exists in Redis cache
-    cache_key = f"chathistory:{user_id}:{session_id}"
-    cached_data = await get_redis_cache(cache_key)
-    if cached_data:
-        logger.info("Returning chat history data")
-        try:
-            # Try to directly parse as JSON
-            return json.loads(cached_data)
-        except json.JSONDecodeError:
-            # If that fails, it might be a JSON string inside a string
+    if not user_id or not session_id:
+        raise HTTPException(status_code=401, detail="Unauthorized: Missing session data")
+    if len(queries) > QUERY_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail=f"A batch accepts at most {QUERY_BATCH_LIMIT} queries")
+    if not queries:
+        return []
+
+    query_dicts = [query.dict() for query in queries]
+    errors = {}
+    insert_error = None
+    try:
+        with mongo_timeout():
+            # One counter round trip at most for the whole batch
+            ids = await query_id_allocator.next_ids(len(query_dicts))
+            for query_dict, query_id in zip(query_dicts, ids):
+                query_dict["id"] = query_id
+                query_dict["user_id"] = user_id
+                query_dict["session_id"] = session_id
+                query_dict["metadata"]["timestamp"] = datetime.now().isoformat()
+            logger.info(f"New query batch of {len(query_dicts)} for session {session_id}")
             try:
-                print("Exception caught")
-                # Remove escape characters and then parse
-                cleaned_data = cached_data.replace('\\', '')
-                if cleaned_data.startswith('"') and cleaned_data.endswith('"'):
-                    cleaned_data = cleaned_data[1:-1]
-                return json.loads(cleaned_data)
-            except Exception as e:
-                logger.error(f"Error parsing chat history: {str(e)}")
-                # Fall back to returning the raw data as a string
-                return {"raw_data": cached_data}
-
-    # If no chat history found, return an empty ChatHistory as a dict
-    empty_history = ChatHistory(
-        user_id=user_id,
-        session_id=session_id,
-        metadata=ChatMetadata(
-            created_at=datetime.now().isoformat(),
-            last_updated_at=datetime.now().isoformat(),
-            app_id="default_app"
-        ),
-        messages=[]
-    )
-    return empty_history.dict()
+                await queries_collection.insert_many(query_dicts, ordered=False)
+            except BulkWriteError as e:
+                # Unordered inserts keep going, only the reported documents are missing
+                errors = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+                logger.error(f"Batch insert failed for {len(errors)} of {len(query_dicts)} queries")
+            except PyMongoError as e:
+                # Part of the batch may have been written before the failure
+                insert_error = e
+    except PyMongoError as e:
+        raise HTTPException(status_code=504 if e.timeout else 500, detail=f"MongoDB error: {str(e)}")
+
+    if insert_error is not None:
+        logger.error(f"Batch insert of {len(query_dicts)} queries interrupted: {insert_error}")
+        try:
+            written = {query["id"] for query in await queries_collection.find(
+                {"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(len(ids))}
+        except PyMongoError as e:
+            # Keep the caches from serving a session that may have changed
+            logger.error(f"Could not check which queries of the batch were written: {e}")
+            await querycache.invalidate(user_id, session_id)
+            return [QueryBatchResult(index=index, id=query_dict["id"], status="indeterminate", error=str(insert_error))
+                    for index, query_dict in enumerate(query_dicts)]
+        errors = {index: str(insert_error) for index, query_dict in enumerate(query_dicts)
+                  if query_dict["id"] not in written}
+
+    stored = [query_dict for index, query_dict in enumerate(query_dicts) if index not in errors]
+    if stored:
+        ai_response = AIResponse(
+            response="Yes",
+            model="ChatGPT"
+        )
+        # The queries are committed, their cache updates and events must not be cut short by the deadline
+        await update_redis(stored, user_id, session_id, ai_response)
+
+    return [
+        QueryBatchResult(index=index, status="failed", error=errors[index]) if index in errors
+        else QueryBatchResult(index=index, id=query_dict["id"], status="created")
+        for index, query_dict in enumerate(query_dicts)
+    ]
 
 # GET a single item by ID
 @router.get("/{query_id}", response_model=Query)
@@ -119,14 +340,18 @@ async def get_query(query_id: int):
     Returns:  \n
         The query data requested.\n
     """
-    query = await queries_collection.find_one({"id": query_id})
+    try:
+        with mongo_timeout():
+            query = await queries_collection.find_one({"id": query_id})
+    except PyMongoError as e:
+        raise HTTPException(status_code=504 if e.timeout else 500, detail=f"MongoDB error: {str(e)}")
     if query:
         return query
     raise HTTPException(status_code=404, reason="Query not found")
 
 # POST a new query
-@router.post("/", response_model=Query)
-async def create_query(query: Query,request: Request, background_tasks: BackgroundTasks):
+@router.post("/", response_model=Query, dependencies=[Depends(enforce_backpressure)])
+async def create_query(query: Query,request: Request):
     """
         POST Creates a query request to the server for processing.\n
         Arguments:  \n
@@ -144,116 +369,27 @@ async def create_query(query: Query,request: Request, background_tasks: Backgrou
         if not user_id or not session_id:
             raise HTTPException(status_code=401, detail="Unauthorized: Missing session data")
 
-        query_dict["id"] = await get_next_id()
-        query_dict["user_id"] = user_id
-        query_dict["session_id"] = session_id
-        query_dict["metadata"]["timestamp"]= datetime.now().isoformat()
-        logger.info(f"New query: {query_dict}")
-        result = await queries_collection.insert_one(query_dict)
+        with mongo_timeout():
+            query_dict["id"] = await get_next_id()
+            query_dict["user_id"] = user_id
+            query_dict["session_id"] = session_id
+            query_dict["metadata"]["timestamp"]= datetime.now().isoformat()
+            logger.info(f"New query: {query_dict}")
+            result = await queries_collection.insert_one(query_dict)
 
         if not result.inserted_id:
             raise HTTPException(status_code=500, detail="Insert failed: No ID returned")
 
 
         #test2va_service(query, user_id, session_id)
-        cache_key = f"querycache:{user_id}:{session_id}"
-
-        # Invalidate (Delete) Redis Cache for `get_queries()`
-        delete_redis_cache(cache_key)
-        logger.info("Redis cache invalidated after inserting new query.")
-
-        # Fetch updated queries from MongoDB
-        queriesdb = await queries_collection.find({"user_id": user_id,"session_id": session_id}).to_list(100)
-
-        # Store the updated queries in Redis
-        await set_redis_cache(cache_key, queriesdb)
-        logger.info("Redis cache updated with new changes.")
-
         ai_response = AIResponse(
             response="Yes",
             model="ChatGPT"
         )
 
-        metadata = QueryMetadata(
-            timestamp=query_dict["metadata"]["timestamp"],
-            app_id=query_dict["metadata"]["app_id"],
-            needs_verification=query_dict["metadata"]["needs_verification"]
-        )
-
-        ai_query_response = AIQueryResponse(
-            id=query_dict.get("id"),
-            user_id=query_dict.get("user_id"),
-            session_id=query_dict.get("session_id"),
-            usercommand=query_dict["usercommand"],
-            metadata=metadata,
-            result=ai_response
-        )
-
-        background_tasks.add_task(send_event,ai_query_response)
-
-
-        chat_history_cache_key = f"chathistory:{user_id}:{session_id}"
-        #Updating chat history
-        chat_history = await get_redis_cache(chat_history_cache_key)
-
-        user_chat = ChatData(
-            #TODO: Needs to generate ids
-            timestamp=query_dict["metadata"]["timestamp"],
-            role= UserRole.User,
-            usercommand=query_dict["usercommand"]
-        )
-        assistant_chat = ChatData(
-            timestamp=datetime.now().isoformat(),
-            role= UserRole.Assistant,
-            usercommand=ai_response.response
-        )
-        if not chat_history :
-
-            chat_history = ChatHistory(
-                user_id=query_dict.get("user_id"),
-                session_id=query_dict.get("session_id"),
-                metadata=ChatMetadata(
-                    created_at=datetime.now().isoformat(),
-                    last_updated_at=datetime.now().isoformat(),
-                    app_id=query_dict["metadata"]["app_id"]
-                ),
-                messages= [user_chat,assistant_chat]
-            )
-
-        else:
-            print(f"Raw chat_history: {chat_history}")
-
-            # First json.loads to get the inner string
-            chat_history_parsed = json.loads(chat_history)
-
-            # If the result is still a string, load it again
-            if isinstance(chat_history_parsed, str):
-                chat_history_dict = json.loads(chat_history_parsed)
-            else:
-                chat_history_dict = chat_history_parsed
-
-            print(f"Double-parsed chat_history_dict type: {type(chat_history_dict)}")
-            print(f"Double-parsed chat_history_dict: {chat_history_dict}")
-
-            # Now the rest of your code should work
-            if "messages" in chat_history_dict and isinstance(chat_history_dict["messages"], list):
-                chat_history_dict["messages"].append(user_chat.dict())
-                chat_history_dict["messages"].append(assistant_chat.dict())
-            else:
-                chat_history_dict["messages"] = [user_chat.dict(), assistant_chat.dict()]
-
-            if "metadata" in chat_history_dict:
-                chat_history_dict["metadata"]["last_updated_at"] = datetime.now().isoformat()
-
-            chat_history = ChatHistory.parse_obj(chat_history_dict)
-
-
-        print("********************")
-        # Then modify how you save the chat history
-        chat_history_dict = chat_history.dict()
-        chat_history_json = json.dumps(chat_history_dict, default=serialize_for_json)
-        await set_redis_cache(chat_history_cache_key, chat_history_json)
-        logger.info(f"After setting redis chat history cache")
+        # The query is committed, its cache updates and event must not be cut short by the deadline
+        await update_redis([query_dict], user_id, session_id, ai_response)
+        logger.info("Redis cache, chat history and stream updated with new changes.")
 
         # Return response from both MongoDB insert & API call
         return Query(
@@ -265,11 +401,14 @@ async def create_query(query: Query,request: Request, background_tasks: Backgrou
         )
 
 
+    except HTTPException:
+        raise
+
     except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="Duplicate key error: ID already exists")
 
     except PyMongoError as e:
-        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+        raise HTTPException(status_code=504 if e.timeout else 500, detail=f"MongoDB error: {str(e)}")
 
     except Exception as e:#TODO: Clean exceptions
 
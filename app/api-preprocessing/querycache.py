@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from common.jsonencoder import dumps_str
+from common.rediscache import redis_client, DEFAULT_CACHE_TTL, DEFAULT_SESSION_TTL
+
+logger = logging.getLogger(__name__)
+
+# Cached query pages expire this long after they were filled
+QUERY_PAGE_TTL = int(os.getenv("QUERY_PAGE_TTL", str(DEFAULT_CACHE_TTL)))
+# The version outlives every page cached under it
+QUERY_VERSION_TTL = int(os.getenv("QUERY_VERSION_TTL", str(DEFAULT_SESSION_TTL)))
+# Unfiltered pages are read from a write-through list of the session's queries
+QUERY_LIST_TTL = int(os.getenv("QUERY_LIST_TTL", str(DEFAULT_CACHE_TTL)))
+# Larger sessions are not cached as a list and are paged from Mongo
+QUERY_LIST_MAX_SIZE = int(os.getenv("QUERY_LIST_MAX_SIZE", "10000"))
+
+# Member scored below every id, only a list holding it is complete. New queries are
+# appended unconditionally, so a list created by an append alone reads as a miss
+LIST_SENTINEL = "#"
+LIST_SENTINEL_SCORE = -1
+
+# Fill the list only if no query was stored since its version was read
+FILL_LIST_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+for i = 3, #ARGV, 1000 do
+    redis.call('ZADD', KEYS[2], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+fill_list_script = redis_client.register_script(FILL_LIST_SCRIPT)
+
+
+def version_key(user_id: str, session_id: str) -> str:
+    """Redis counter bumped whenever a session's queries change."""
+    return f"querycache:{user_id}:{session_id}:version"
+
+
+def page_key(user_id: str, session_id: str, etag: str) -> str:
+    """Redis hash holding one cached page of a session's queries."""
+    digest = etag.strip('"')
+    return f"querycache:{user_id}:{session_id}:page:{digest}"
+
+
+def list_key(user_id: str, session_id: str) -> str:
+    """Redis sorted set holding every query of a session, scored by id."""
+    return f"querycache:{user_id}:{session_id}:list"
+
+
+def encode_query(query_dict: Dict[str, Any]) -> str:
+    """Encode a query document as returned by the API, without Mongo's `_id`."""
+    return dumps_str({name: value for name, value in query_dict.items() if name != "_id"})
+
+
+def list_args(query_dicts: List[Dict[str, Any]]) -> List[Any]:
+    """Flatten query documents into ZADD score/member arguments."""
+    return [arg for query_dict in query_dicts for arg in (query_dict["id"], encode_query(query_dict))]
+
+
+def page_etag(version: str, params: Dict[str, Optional[str]]) -> str:
+    """
+    Build the ETag of a page from the session version and the page parameters.
+    Args:
+        version: Current version of the session's queries
+        params: Cursor, limit and filters of the page
+    Returns:
+        Quoted ETag value
+    """
+    canonical = "&".join(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+    return f'"{hashlib.sha1(f"{version}|{canonical}".encode()).hexdigest()}"'
+
+
+async def get_version(user_id: str, session_id: str) -> Optional[str]:
+    """
+    Read the version of a session's queries, starting a new one if none exists.
+    A new version is seeded from the clock so pages cached under an expired
+    version are never matched again.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+    Returns:
+        The current version, or None on error
+    """
+    key = version_key(user_id, session_id)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(key, time.time_ns(), nx=True, ex=QUERY_VERSION_TTL)
+            pipe.get(key)
+            _, version = await pipe.execute()
+        return version
+    except RedisError as e:
+        logger.error(f"Redis error when retrieving query version: {e}")
+        return None
+
+
+def queue_bump_version(pipe, user_id: str, session_id: str) -> None:
+    """
+    Queue a version bump on a Redis pipeline, invalidating the cached filtered pages.
+    Args:
+        pipe: Redis pipeline to add the commands to
+        user_id: User identifier
+        session_id: Session identifier
+    """
+    key = version_key(user_id, session_id)
+    pipe.incr(key)
+    pipe.expire(key, QUERY_VERSION_TTL)
+
+
+async def invalidate(user_id: str, session_id: str) -> bool:
+    """
+    Drop every cached page and the session list, used when the stored queries are unknown.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+    Returns:
+        True if the caches were invalidated, False on error
+    """
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            queue_bump_version(pipe, user_id, session_id)
+            pipe.delete(list_key(user_id, session_id))
+            await pipe.execute()
+        return True
+    except RedisError as e:
+        logger.error(f"Redis error when invalidating query caches: {e}")
+        return False
+
+
+def queue_append(pipe, user_id: str, session_id: str, query_dicts: List[Dict[str, Any]]) -> None:
+    """
+    Queue an O(log n) append of new queries to the session list on a Redis pipeline.
+    Args:
+        pipe: Redis pipeline to add the commands to
+        user_id: User identifier
+        session_id: Session identifier
+        query_dicts: Stored query documents
+    """
+    key = list_key(user_id, session_id)
+    pipe.zadd(key, {encode_query(query_dict): query_dict["id"] for query_dict in query_dicts})
+    pipe.expire(key, QUERY_LIST_TTL)
+
+
+async def fill_list(user_id: str, session_id: str, version: str, query_dicts: List[Dict[str, Any]]) -> bool:
+    """
+    Cache every query of a session as a list.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        version: Version read before the queries were loaded from Mongo
+        query_dicts: Every query document of the session
+    Returns:
+        True if the list was cached, False if a query was stored meanwhile or on error
+    """
+    args = [version, QUERY_LIST_TTL, LIST_SENTINEL_SCORE, LIST_SENTINEL, *list_args(query_dicts)]
+    try:
+        return bool(await fill_list_script(keys=[version_key(user_id, session_id), list_key(user_id, session_id)],
+                                           args=args))
+    except RedisError as e:
+        logger.error(f"Redis error when caching query list: {e}")
+        return False
+
+
+async def get_list_page(user_id: str,
+                        session_id: str,
+                        after: Optional[int],
+                        limit: int) -> Tuple[Optional[List[str]], Optional[int]]:
+    """
+    Read an unfiltered page from the session list in a single round trip.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        after: Return queries with an id greater than this cursor
+        limit: Maximum number of queries to return
+    Returns:
+        Tuple of (encoded queries, next cursor), queries is None on a cache miss
+    """
+    key = list_key(user_id, session_id)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zscore(key, LIST_SENTINEL)
+            # One extra query tells whether a next page exists
+            pipe.zrangebyscore(key, f"({max(after or 0, 0)}", "+inf", start=0, num=limit + 1, withscores=True)
+            complete, members = await pipe.execute()
+    except RedisError as e:
+        logger.error(f"Redis error when retrieving query list: {e}")
+        return None, None
+    if complete is None:
+        return None, None
+    next_cursor = int(members[limit - 1][1]) if len(members) > limit else None
+    return [member for member, _ in members[:limit]], next_cursor
+
+
+async def get_page(user_id: str, session_id: str, etag: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Read a cached page.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        etag: ETag identifying the page
+    Returns:
+        Tuple of (JSON body, next cursor), body is None on a cache miss
+    """
+    try:
+        body, next_cursor = await redis_client.hmget(page_key(user_id, session_id, etag), "body", "next")
+        return body, next_cursor or None
+    except RedisError as e:
+        logger.error(f"Redis error when retrieving query page: {e}")
+        return None, None
+
+
+async def set_page(user_id: str, session_id: str, etag: str, body: str, next_cursor: Optional[int]) -> bool:
+    """
+    Cache a page.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        etag: ETag identifying the page
+        body: JSON body of the page
+        next_cursor: Cursor of the following page, None on the last page
+    Returns:
+        True if the page was cached, False on error
+    """
+    key = page_key(user_id, session_id, etag)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={"body": body, "next": "" if next_cursor is None else next_cursor})
+            pipe.expire(key, QUERY_PAGE_TTL)
+            await pipe.execute()
+        return True
+    except RedisError as e:
+        logger.error(f"Redis error when caching query page: {e}")
+        return False
@@ -108,3 +108,10 @@ class QueryResult(Query):
 #Input to postprocessing service
 class AIQueryResponse(Query):
     result: AIResponse
+
+#Outcome of a single query in a batch ingestion
+class QueryBatchResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from redis.exceptions import RedisError
+
+from common.rediscache import redis_client
+from events import PREPROCESS_STREAMS, session_stream
+
+logger = logging.getLogger(__name__)
+
+# How often consumer lag is sampled and acknowledged entries are trimmed
+STREAM_MONITOR_INTERVAL = float(os.getenv("STREAM_MONITOR_INTERVAL", "2"))
+# Outstanding entries (undelivered plus unacknowledged) above which new queries are rejected
+STREAM_MAX_LAG = int(os.getenv("STREAM_MAX_LAG", "10000"))
+
+
+def stream_id_key(entry_id: str) -> Tuple[int, int]:
+    """Split a stream ID into comparable (milliseconds, sequence) parts."""
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def next_stream_id(entry_id: str) -> str:
+    """Return the smallest stream ID greater than `entry_id`."""
+    ms, seq = stream_id_key(entry_id)
+    return f"{ms}-{seq + 1}"
+
+
+class StreamMonitor:
+    """
+    Samples consumer-group lag of the partition streams and trims what every group has acknowledged.
+
+    The lag is refreshed in the background so checking it on the request
+    path costs no Redis round trip.
+    """
+
+    def __init__(self, streams: List[str]):
+        self.streams = streams
+        self.lags: Dict[str, int] = {stream: 0 for stream in streams}
+        self.trimmed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self, stream: str) -> None:
+        """Sample the lag of every consumer group of a stream and trim acknowledged entries."""
+        groups = await redis_client.xinfo_groups(stream)
+        lag = 0
+        min_id: Optional[str] = None
+        for group in groups:
+            pending = await redis_client.xpending(stream, group["name"])
+            # Redis 7 reports undelivered entries, older servers only pending ones
+            lag = max(lag, (group.get("lag") or 0) + pending["pending"])
+            # Entries before the oldest pending one, up to the last delivered, are acknowledged
+            group_min = pending["min"] if pending["pending"] else next_stream_id(group["last-delivered-id"])
+            if min_id is None or stream_id_key(group_min) < stream_id_key(min_id):
+                min_id = group_min
+        self.lags[stream] = lag
+        if min_id:
+            self.trimmed += await redis_client.xtrim(stream, minid=min_id, approximate=True)
+
+    async def monitor_loop(self) -> None:
+        """Refresh the lag of every stream in the background until cancelled."""
+        while True:
+            for stream in self.streams:
+                try:
+                    await self.refresh(stream)
+                except RedisError as e:
+                    # A missing stream has no groups yet, nothing to trim
+                    logger.debug(f"Could not sample stream {stream}: {e}")
+            await asyncio.sleep(STREAM_MONITOR_INTERVAL)
+
+    def start(self) -> None:
+        """Start background monitoring."""
+        self._task = asyncio.create_task(self.monitor_loop())
+
+    async def close(self) -> None:
+        """Stop background monitoring."""
+        if self._task:
+            self._task.cancel()
+
+
+stream_monitor = StreamMonitor(PREPROCESS_STREAMS)
+
+
+async def enforce_backpressure(request: Request) -> None:
+    """
+    Reject new queries while the consumers of the session's partition lag too far behind.
+    Args:
+        request: Incoming request, carrying the `session-id` header
+    Raises:
+        HTTPException: 429 with `Retry-After` when the lag is above STREAM_MAX_LAG
+    """
+    stream = session_stream(request.headers.get("session-id"))
+    lag = stream_monitor.lags.get(stream, 0)
+    if lag > STREAM_MAX_LAG:
+        logger.warning(f"Stream {stream} lag {lag} is above {STREAM_MAX_LAG}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many queries waiting to be processed, retry later",
+            headers={"Retry-After": str(max(1, round(STREAM_MONITOR_INTERVAL)))},
+        )
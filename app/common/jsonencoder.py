@@ -0,0 +1,67 @@
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Union
+
+from bson import ObjectId
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """
+    Encode values the JSON backend does not handle natively.
+    Args:
+        obj: Value to encode
+    Returns:
+        A JSON compatible value
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Encode Mongo documents, datetimes, enums and ObjectIds to compact JSON in a single pass.
+    Args:
+        data: Value to encode
+    Returns:
+        UTF-8 encoded JSON
+    """
+    if orjson:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(",", ":")).encode()
+
+
+def dumps_str(data: Any) -> str:
+    """
+    Encode a value like `dumps`, returning text.
+    Args:
+        data: Value to encode
+    Returns:
+        JSON text
+    """
+    if orjson:
+        return orjson.dumps(data, default=_default).decode()
+    return json.dumps(data, default=_default, separators=(",", ":"))
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Decode JSON with the fastest available backend.
+    Args:
+        data: JSON bytes or text
+    Returns:
+        The decoded value
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,225 @@
+import logging
+import os
+from contextvars import ContextVar
+from datetime import timedelta
+from typing import Any, List, Optional, Union
+
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, RedisError, TimeoutError
+
+from common.jsonencoder import dumps
+
+logger = logging.getLogger(__name__)
+
+# Configuration from environment variables with defaults
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "5"))
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "3"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+DEFAULT_CACHE_TTL = int(os.getenv("DEFAULT_CACHE_TTL", "600"))  # 10 minutes
+DEFAULT_SESSION_TTL = int(os.getenv("DEFAULT_SESSION_TTL", "3600"))
+SESSION_REVOKED_CHANNEL = os.getenv("SESSION_REVOKED_CHANNEL", "session:revoked")
+
+
+
+class RoundTripCounter:
+    """Number of Redis round trips made while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+
+
+# Counter of the request being handled, None when nobody is measuring
+redis_round_trips: ContextVar[Optional[RoundTripCounter]] = ContextVar("redis_round_trips", default=None)
+
+
+class CountingConnection(redis.Connection):
+    """
+    Connection counting the packets it sends.
+    A pipeline is sent as a single packet, so each send is one round trip.
+    """
+
+    async def send_packed_command(self, command, check_health: bool = True) -> None:
+        counter = redis_round_trips.get()
+        if counter is not None:
+            counter.count += 1
+        await super().send_packed_command(command, check_health)
+
+
+# Shared non-blocking connection pool used by every service
+redis_pool = redis.BlockingConnectionPool(
+    connection_class=CountingConnection,
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    password=REDIS_PASSWORD,
+    decode_responses=True,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_CONNECT_TIMEOUT,  # Wait for a free pooled connection
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    socket_keepalive=True,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    retry=Retry(ExponentialBackoff(cap=1, base=0.05), REDIS_RETRIES),
+    retry_on_error=[ConnectionError, TimeoutError],
+)
+
+# Connect to Redis
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+
+async def cache_exists(cache_key: str) -> bool:
+    """
+    Check if a key exists in Redis cache.
+    Args:
+        cache_key: Redis key to check
+    Returns:
+        True if key exists, False otherwise
+    """
+    try:
+        return bool(await redis_client.exists(cache_key))
+    except RedisError as e:
+        logger.error(f"Redis error when checking key existence: {e}")
+        return False
+
+
+async def get_redis_cache(cache_key: str) -> Optional[str]:
+    """
+    Get value from Redis cache.
+    Args:
+        cache_key: Redis key to retrieve
+    Returns:
+        Cache value or None if key doesn't exist or error occurs
+    """
+    try:
+        return await redis_client.get(cache_key)
+    except RedisError as e:
+        logger.error(f"Redis error when retrieving cache: {e}")
+        return None
+
+
+async def set_redis_cache(cache_key: str,
+                          data: Any,
+                          ttl: int = DEFAULT_CACHE_TTL) -> bool:
+    """
+    Store data in Redis cache with expiration.
+    Args:
+        cache_key: Redis key to store
+        data: Data to store in cache
+        ttl: Time to live in seconds
+    Returns:
+        True if successfully set, False otherwise
+    """
+    try:
+        return bool(await redis_client.setex(cache_key, ttl, dumps(data)))
+    except (RedisError, TypeError, ValueError) as e:
+        logger.error(f"Error setting Redis cache: {e}")
+        return False
+
+
+async def delete_redis_cache(cache_key: str) -> bool:
+    """
+    Delete a key from Redis cache.
+    Args:
+        cache_key: Redis key to delete
+    Returns:
+        True if the key was removed, False otherwise
+    """
+    try:
+        return bool(await redis_client.delete(cache_key))
+    except RedisError as e:
+        logger.error(f"Redis error when deleting cache: {e}")
+        return False
+
+
+async def store_session(
+        user_id: str,
+        session_id: str,
+        jwt_token: str,
+        ttl: Union[int, timedelta] = DEFAULT_SESSION_TTL
+) -> bool:
+    """
+    Store session in Redis with expiration.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+        jwt_token: JWT token to store
+        ttl: Time to live in seconds or as timedelta
+    Returns:
+        True if successfully set, False otherwise
+    """
+    session_key = f"session:{user_id}:{session_id}"
+
+    # Convert timedelta to seconds if needed
+    if isinstance(ttl, timedelta):
+        ttl = int(ttl.total_seconds())
+
+    try:
+        return bool(await redis_client.setex(session_key, ttl, jwt_token))
+    except RedisError as e:
+        logger.error(f"Error storing session: {e}")
+        return False
+
+
+async def logout_user(user_id: str, session_id: str) -> bool:
+    """
+    Remove the session from Redis to invalidate JWT.
+    Args:
+        user_id: User identifier
+        session_id: Session identifier
+    Returns:
+        True if successfully removed, False otherwise
+    """
+    session_key = f"session:{user_id}:{session_id}"
+    try:
+        deleted = bool(await redis_client.delete(session_key))
+        # Tell every gateway worker to drop its cached copy of the session
+        await redis_client.publish(SESSION_REVOKED_CHANNEL, session_key)
+        return deleted
+    except RedisError as e:
+        logger.error(f"Error during logout: {e}")
+        return False
+
+
+async def ping_redis() -> bool:
+    """
+    Check if Redis connection is healthy.
+    Returns:
+        True if Redis responds to ping, False otherwise
+    """
+    try:
+        return bool(await redis_client.ping())
+    except RedisError:
+        return False
+
+
+async def clear_user_cache(user_id: str) -> int:
+    """
+    Clear all cache entries for a specific user.
+    Args:
+        user_id: User identifier
+    Returns:
+        Number of keys deleted
+    """
+    pattern = f"querycache:{user_id}:*"
+    try:
+        # SCAN instead of KEYS so a large keyspace never blocks Redis
+        keys: List[str] = [key async for key in redis_client.scan_iter(match=pattern, count=500)]
+        if keys:
+            return await redis_client.delete(*keys)
+        return 0
+    except RedisError as e:
+        logger.error(f"Error clearing user cache: {e}")
+        return 0
+
+
+async def close_redis() -> None:
+    """Release every pooled Redis connection on shutdown."""
+    await redis_client.aclose()
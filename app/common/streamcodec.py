@@ -0,0 +1,80 @@
+import zlib
+from typing import Any, Dict, List
+
+from common.jsonencoder import dumps_str, loads
+
+# Wire format of stream entries: {"v": <format version>, "d": <compact JSON payload>}
+VERSION_FIELD = "v"
+DATA_FIELD = "d"
+STREAM_FORMAT_VERSION = "1"
+
+
+class StreamDecodeError(ValueError):
+    """Raised when a stream entry is not in a supported wire format."""
+
+
+def encode_event(payload: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Encode an event payload as stream entry fields.
+    Args:
+        payload: Event payload, may contain datetimes, enums and ObjectIds
+    Returns:
+        Field/value mapping for XADD
+    """
+    return {VERSION_FIELD: STREAM_FORMAT_VERSION, DATA_FIELD: dumps_str(payload)}
+
+
+def decode_event(fields: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Decode the fields of a stream entry back into its payload.
+    Args:
+        fields: Field/value mapping read with XREAD/XREADGROUP
+    Returns:
+        The event payload
+    Raises:
+        StreamDecodeError: If the entry has no version, an unknown version or a corrupt payload
+    """
+    version = fields.get(VERSION_FIELD)
+    if version != STREAM_FORMAT_VERSION:
+        raise StreamDecodeError(f"Unsupported stream format version: {version}")
+    try:
+        return loads(fields[DATA_FIELD])
+    except (KeyError, ValueError) as e:
+        raise StreamDecodeError(f"Invalid stream payload: {e}") from e
+
+
+def partition_for(session_id: str, partitions: int) -> int:
+    """
+    Map a session to its stream partition, so all its events stay in one ordered stream.
+    Args:
+        session_id: Session identifier
+        partitions: Number of partitions
+    Returns:
+        Partition index in [0, partitions)
+    """
+    return zlib.crc32(session_id.encode()) % partitions
+
+
+def partition_stream(stream: str, partition: int, partitions: int) -> str:
+    """
+    Name of a partition stream. A single partition keeps the unpartitioned name.
+    Args:
+        stream: Base stream name
+        partition: Partition index
+        partitions: Number of partitions
+    Returns:
+        Stream name
+    """
+    return stream if partitions == 1 else f"{stream}:{partition}"
+
+
+def partition_streams(stream: str, partitions: int) -> List[str]:
+    """
+    Names of every partition stream.
+    Args:
+        stream: Base stream name
+        partitions: Number of partitions
+    Returns:
+        Stream names in partition order
+    """
+    return [partition_stream(stream, partition, partitions) for partition in range(partitions)]
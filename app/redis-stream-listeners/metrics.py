@@ -0,0 +1,90 @@
+import redis.asyncio as redis
+import asyncio
+import logging, os, time
+from typing import List, Set, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Prometheus scrape endpoint served by every listener
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
+METRICS_INTERVAL = float(os.environ.get('METRICS_INTERVAL', 5))  # Seconds between stream samples
+
+logger = logging.getLogger(__name__)
+
+STREAM_LENGTH = Gauge("stream_length", "Entries currently held in the stream", ["stream"])
+GROUP_LAG = Gauge("stream_group_lag", "Entries not yet delivered to the consumer group", ["stream", "group"])
+GROUP_PENDING = Gauge("stream_group_pending", "Entries delivered but not acknowledged", ["stream", "group"])
+CONSUMER_PENDING = Gauge("stream_consumer_pending", "Entries pending per consumer", ["stream", "group", "consumer"])
+CONSUMER_IDLE = Gauge("stream_consumer_idle_seconds", "Time since the consumer last interacted with the stream",
+                      ["stream", "group", "consumer"])
+OWNED_PARTITIONS = Gauge("stream_owned_partitions", "Partitions owned by this listener")
+FORWARD_LATENCY = Histogram("stream_forward_latency_seconds", "Time from XADD to an accepted forward", ["stream"],
+                            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+FORWARDED = Counter("stream_forwarded_total", "Entries accepted by postprocessing", ["stream"])
+DEAD_LETTERED = Counter("stream_dead_lettered_total", "Entries moved to the dead-letter stream", ["stream"])
+
+
+def entry_age(entry_id: str) -> float:
+    """Seconds since an entry was added, from the millisecond timestamp in its ID"""
+    return max(0.0, time.time() - int(entry_id.split("-", 1)[0]) / 1000)
+
+
+def observe_forwarded(stream: str, entry_ids: List[str]) -> None:
+    """Record the enqueue-to-forward latency of accepted entries"""
+    for entry_id in entry_ids:
+        FORWARD_LATENCY.labels(stream).observe(entry_age(entry_id))
+    FORWARDED.labels(stream).inc(len(entry_ids))
+
+
+def observe_dead_lettered(stream: str) -> None:
+    """Count an entry moved to the dead-letter stream"""
+    DEAD_LETTERED.labels(stream).inc()
+
+
+async def sample_stream(redis_client, stream: str, consumers: Set[Tuple[str, str, str]]) -> None:
+    """Refresh the length, group and consumer gauges of one stream, collecting the consumer labels seen"""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.xlen(stream)
+        pipe.xinfo_groups(stream)
+        length, groups = await pipe.execute()
+    STREAM_LENGTH.labels(stream).set(length)
+    for group in groups:
+        GROUP_LAG.labels(stream, group["name"]).set(group.get("lag") or 0)
+        GROUP_PENDING.labels(stream, group["name"]).set(group["pending"])
+        for consumer in await redis_client.xinfo_consumers(stream, group["name"]):
+            CONSUMER_PENDING.labels(stream, group["name"], consumer["name"]).set(consumer["pending"])
+            CONSUMER_IDLE.labels(stream, group["name"], consumer["name"]).set(consumer["idle"] / 1000)
+            consumers.add((stream, group["name"], consumer["name"]))
+
+
+async def collect_metrics(redis_client, streams: List[str], owned, stop: asyncio.Event) -> None:
+    """
+    Sample every partition stream until stopped.
+    Args:
+        redis_client: Redis connection
+        streams: Every partition stream, sampled whoever owns them
+        owned: Returns the partitions owned by this listener
+        stop: Set on shutdown
+    """
+    reported: Set[Tuple[str, str, str]] = set()
+    while not stop.is_set():
+        consumers: Set[Tuple[str, str, str]] = set()
+        for stream in streams:
+            try:
+                await sample_stream(redis_client, stream, consumers)
+            except redis.RedisError as e:
+                # The stream or its group may not exist before the first event
+                logger.debug(f"Could not sample stream {stream}: {e}")
+        # Consumers that left must not keep reporting their last values
+        for labels in reported - consumers:
+            CONSUMER_PENDING.remove(*labels)
+            CONSUMER_IDLE.remove(*labels)
+        reported = consumers
+        OWNED_PARTITIONS.set(len(owned()))
+        await asyncio.sleep(METRICS_INTERVAL)
+
+
+def start_metrics_server() -> None:
+    """Serve the Prometheus metrics endpoint"""
+    start_http_server(METRICS_PORT)
+    logger.info(f"Serving metrics on port {METRICS_PORT}")
@@ -0,0 +1,136 @@
+import redis.asyncio as redis
+import asyncio
+import logging, math, os, random, time
+from typing import Callable, List, Set
+
+from common.streamcodec import partition_streams
+
+# Sessions are spread over this many streams, must match the producers
+STREAM_PARTITIONS = int(os.environ.get('STREAM_PARTITIONS', 1))
+# A partition is owned by one consumer at a time through a lease renewed every LEASE_MS / 3
+LEASE_MS = int(os.environ.get('LEASE_MS', 15000))
+
+logger = logging.getLogger(__name__)
+
+# Only the lease holder may renew or release it
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class PartitionCoordinator:
+    """
+    Spreads the partition streams over the live consumers.
+
+    Every consumer heartbeats into a registry and holds at most its fair
+    share of partitions, ceil(partitions / live consumers), through leases.
+    A partition handed over is released only once its in-flight entries
+    are done, so its sessions are never processed by two consumers at once.
+    """
+
+    def __init__(self, redis_client, stream: str, group: str, consumer: str, partitions: int = STREAM_PARTITIONS):
+        self.redis_client = redis_client
+        self.group = group
+        self.consumer = consumer
+        self.streams = partition_streams(stream, partitions)
+        self.registry_key = f"{stream}:consumers"
+        self.owned: Set[str] = set()
+        self.releasing: Set[str] = set()
+        self.renew_lease = redis_client.register_script(RENEW_LEASE_SCRIPT)
+        self.release_lease = redis_client.register_script(RELEASE_LEASE_SCRIPT)
+
+    @staticmethod
+    def lease_key(stream: str) -> str:
+        """Key holding the name of the consumer owning a partition"""
+        return f"{stream}:owner"
+
+    def readable_streams(self) -> List[str]:
+        """Partitions this consumer reads new entries from"""
+        return sorted(self.owned - self.releasing)
+
+    async def heartbeat(self) -> int:
+        """Register this consumer as alive and count the live consumers"""
+        now = time.time() * 1000
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.registry_key, {self.consumer: now})
+            pipe.zremrangebyscore(self.registry_key, 0, now - LEASE_MS)
+            pipe.zcard(self.registry_key)
+            _, _, live = await pipe.execute()
+        return max(1, live)
+
+    async def claim(self, stream: str) -> bool:
+        """Try to take the lease of a free partition"""
+        if not await self.redis_client.set(self.lease_key(stream), self.consumer, nx=True, px=LEASE_MS):
+            return False
+        try:
+            await self.redis_client.xgroup_create(stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        logger.info(f"Consumer {self.consumer} claimed partition {stream}")
+        return True
+
+    async def release(self, stream: str) -> None:
+        """Give a partition back"""
+        await self.release_lease(keys=[self.lease_key(stream)], args=[self.consumer])
+        self.owned.discard(stream)
+        self.releasing.discard(stream)
+        logger.info(f"Consumer {self.consumer} released partition {stream}")
+
+    async def rebalance(self, drained: Callable[[str], bool]) -> None:
+        """
+        Renew owned leases and move towards this consumer's fair share.
+        Args:
+            drained: Tells whether a partition has no entry in flight anymore
+        """
+        target = math.ceil(len(self.streams) / await self.heartbeat())
+
+        for stream in list(self.owned):
+            if not await self.renew_lease(keys=[self.lease_key(stream)], args=[self.consumer, LEASE_MS]):
+                # Expired while this consumer was stalled, another one may own it now
+                logger.warning(f"Consumer {self.consumer} lost partition {stream}")
+                self.owned.discard(stream)
+                self.releasing.discard(stream)
+
+        # Hand over extra partitions once their in-flight entries are done
+        surplus = len(self.owned) - target
+        for stream in sorted(self.owned, reverse=True):
+            if surplus <= 0:
+                break
+            self.releasing.add(stream)
+            surplus -= 1
+        for stream in list(self.releasing):
+            if drained(stream):
+                await self.release(stream)
+
+        free = [stream for stream in self.streams if stream not in self.owned]
+        random.shuffle(free)  # Spread concurrent claims of starting consumers
+        for stream in free:
+            if len(self.owned) >= target:
+                break
+            if await self.claim(stream):
+                self.owned.add(stream)
+
+    async def run(self, stop: asyncio.Event, drained: Callable[[str], bool]) -> None:
+        """Keep leases renewed and balanced until stopped"""
+        while not stop.is_set():
+            try:
+                await self.rebalance(drained)
+            except redis.RedisError as e:
+                logger.error(f"Error rebalancing partitions: {e}")
+            await asyncio.sleep(LEASE_MS / 3000)
+
+    async def close(self) -> None:
+        """Release every partition and leave the registry"""
+        for stream in list(self.owned):
+            await self.release(stream)
+        await self.redis_client.zrem(self.registry_key, self.consumer)
@@ -1,8 +1,15 @@
-import redis
-import logging,json, os
-import time,httpx,traceback, threading
+import redis.asyncio as redis
+import asyncio
+import logging,json, os, random, signal, socket
+import httpx,traceback
 from fastapi import HTTPException
+from collections import deque
 from datetime import datetime
+from itertools import islice
+from typing import Deque, Dict, Set
+from common.streamcodec import decode_event, StreamDecodeError
+from partitions import PartitionCoordinator
+from metrics import collect_metrics, observe_dead_lettered, observe_forwarded, start_metrics_server
 
 
 # Redis connection details from environment variables with defaults
@@ -11,13 +18,37 @@ REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
 #REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD', None)
 REDIS_STREAM_NAME = os.environ.get('REDIS_STREAM_NAME', 'preprocess_request')
 CONSUMER_GROUP = os.environ.get('CONSUMER_GROUP', 'post-processing-grp')
-CONSUMER_NAME = os.environ.get('CONSUMER_NAME', 'preprocess_request')
+# Unique per process so every replica owns its own pending entries
+CONSUMER_NAME = os.environ.get('CONSUMER_NAME', f"{socket.gethostname()}-{os.getpid()}")
 BLOCK_MS = int(os.environ.get('BLOCK_MS', 5000))  # Time to block waiting for new messages
-
+READ_COUNT = int(os.environ.get('READ_COUNT', 50))  # Maximum entries fetched per XREADGROUP
+WORKER_COUNT = int(os.environ.get('WORKER_COUNT', 16))  # Sessions forwarded concurrently
+SESSION_BUFFER = int(os.environ.get('SESSION_BUFFER', READ_COUNT))  # Entries buffered per session, the rest stay pending
+MAX_BUFFERED = int(os.environ.get('MAX_BUFFERED', WORKER_COUNT * READ_COUNT))  # Reading pauses past this many entries
+# Entries of ready sessions are sent together, up to BATCH_SIZE or once the first one waited BATCH_WAIT_MS
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 20))
+BATCH_WAIT_MS = int(os.environ.get('BATCH_WAIT_MS', 10))
+
+# Failed messages are retried with exponential backoff, then moved to the dead-letter stream
+MAX_ATTEMPTS = int(os.environ.get('MAX_ATTEMPTS', 5))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 30))
+DEAD_LETTER_STREAM = os.environ.get('DEAD_LETTER_STREAM', f"{REDIS_STREAM_NAME}:dead")
+DEAD_LETTER_MAXLEN = int(os.environ.get('DEAD_LETTER_MAXLEN', 100000))  # Enforced approximately on every XADD
+
+# Entries pending longer than this are reclaimed from crashed consumers, keep it above RETRY_MAX_DELAY
+RECLAIM_IDLE_MS = int(os.environ.get('RECLAIM_IDLE_MS', 60000))
+RECLAIM_INTERVAL = float(os.environ.get('RECLAIM_INTERVAL', 15))
+
+# Pooled HTTP client to postprocessing
+POSTPROCESSING_MAX_CONNECTIONS = int(os.environ.get('POSTPROCESSING_MAX_CONNECTIONS', WORKER_COUNT))
+POSTPROCESSING_TIMEOUT = float(os.environ.get('POSTPROCESSING_TIMEOUT', 10))
 
 
 # Define backend microservices URLs
 POSTPROCESSING_API_URL = os.environ.get("POSTPROCESSING_URL")
+POSTPROCESSING_BATCH_URL = os.environ.get("POSTPROCESSING_BATCH_URL",
+                                          f"{(POSTPROCESSING_API_URL or '').rstrip('/')}/batch")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,7 +57,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def connect_to_redis():
+async def connect_to_redis():
     """Establish a connection to Redis server with retry logic"""
     max_retries = 5
     retry_count = 0
@@ -38,10 +69,13 @@ def connect_to_redis():
                 host=REDIS_HOST,
                 port=REDIS_PORT,
                 db=0,
-                decode_responses=True  # Automatically decode response bytes to strings
+                decode_responses=True,  # Automatically decode response bytes to strings
+                # XREADGROUP blocks server side, the socket must outlive the block
+                socket_timeout=BLOCK_MS / 1000 + 5,
+                socket_keepalive=True,
             )
             # Test the connection
-            redis_client.ping()
+            await redis_client.ping()
             logger.info(f"Successfully connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
             return redis_client
         except redis.ConnectionError as e:
@@ -49,133 +83,494 @@ def connect_to_redis():
             wait_time = backoff_factor ** retry_count
             logger.error(f"Failed to connect to Redis: {e}")
             logger.info(f"Retrying in {wait_time:.1f} seconds... (Attempt {retry_count}/{max_retries})")
-            time.sleep(wait_time)
+            await asyncio.sleep(wait_time)
 
     raise Exception(f"Could not connect to Redis after {max_retries} attempts")
 
-def setup_consumer_group(redis_client, stream, group):
-    """Create consumer group if it doesn't exist"""
-    try:
-        redis_client.xgroup_create(REDIS_STREAM_NAME, CONSUMER_GROUP, id='0', mkstream=True)
-        logger.info(f"Created consumer group '{group}' for stream '{stream}'")
-    except redis.ResponseError as e:
-        if 'BUSYGROUP' in str(e):
-            logger.info(f"Consumer group '{group}' already exists for stream '{stream}'")
-        else:
-            raise
-
-
-
-def redis_polling():
-    """Main function to poll Redis stream continuously"""
-    redis_client = connect_to_redis()
-    setup_consumer_group(redis_client, REDIS_STREAM_NAME, CONSUMER_GROUP)
-
-    # Track last processed ID for recovery
-    last_id = '0'  # Start from the beginning
-    while True:
+def create_http_client() -> httpx.AsyncClient:
+    """Build the pooled, keep-alive client shared by every worker"""
+    return httpx.AsyncClient(
+        timeout=POSTPROCESSING_TIMEOUT,
+        limits=httpx.Limits(max_connections=POSTPROCESSING_MAX_CONNECTIONS,
+                            max_keepalive_connections=POSTPROCESSING_MAX_CONNECTIONS),
+    )
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter before retry number `attempt`"""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+def is_retryable(error: HTTPException) -> bool:
+    """Client errors other than timeouts and throttling will fail again"""
+    return not 400 <= error.status_code < 500 or error.status_code in (408, 424, 429)
+
+
+class StreamConsumer:
+    """
+    Consumes the partitions this instance owns with a fixed pool of workers.
+
+    Entries are buffered per session and a session is handed to one worker
+    at a time, so each session is forwarded in stream order while different
+    sessions run in parallel. An entry is acknowledged only once
+    postprocessing accepted it. A failed entry holds back its own session
+    only: the session sits out its backoff on a timer while the reader and
+    the workers carry on with the others. Past SESSION_BUFFER entries, new
+    entries of a session stay pending in Redis and are fetched back once it
+    catches up, so a failing session never fills the buffer. The entries a
+    previous owner left pending are taken over before a claimed partition
+    is read, entries left pending by crashed consumers are reclaimed with
+    XAUTOCLAIM, and entries that keep failing go to the dead-letter stream.
+    """
+
+    def __init__(self, redis_client, http_client: httpx.AsyncClient, coordinator: PartitionCoordinator):
+        self.redis_client = redis_client
+        self.http_client = http_client
+        self.coordinator = coordinator
+        self.sessions: Dict[str, Deque[tuple]] = {}  # Buffered entries per session, in stream order
+        self.spilled: Dict[str, Deque[tuple]] = {}  # (stream, entry ID, attempt) left pending behind a full session
+        self.scheduled: Set[str] = set()  # Sessions waiting for a worker, forwarding or held back
+        self.held: Dict[str, asyncio.TimerHandle] = {}  # Sessions sitting out a retry delay
+        self.ready = asyncio.Queue()  # Sessions waiting for a worker
+        self.in_flight = {}  # Entry IDs buffered or spilled, per partition stream
+        self.buffered = 0
+        self.room = asyncio.Event()  # Cleared while MAX_BUFFERED entries are buffered
+        self.room.set()
+        self.started: Set[str] = set()  # Partitions whose previous owner's pending entries were taken over
+        self.stopping = False
+
+    def drained(self, stream: str) -> bool:
+        """Tell whether a partition has no entry in flight"""
+        return not self.in_flight.get(stream)
+
+    async def enqueue(self, stream: str, entry_id: str, data: dict, attempt: int = 1) -> None:
+        """Buffer an entry behind the earlier ones of its session, never waiting"""
         try:
-            logger.debug(f"Starting to listen for messages on stream '{REDIS_STREAM_NAME}'")
-            messages = redis_client.xreadgroup(
-                groupname=CONSUMER_GROUP,
-                consumername=CONSUMER_NAME,
-                streams={REDIS_STREAM_NAME: '>'},  # Read new messages
-                count=10,
-                block=5000  # Blocks for 5 sec if no messages are available
-            )
-
-            if messages:
-                for stream, entries in messages:
-                    for entry_id, data in entries:
-                        logger.info(f"Processing message {entry_id}: {data}")
-                        # Forwarding the request to post procecessing server
-                        """Main function that processes data and forwards it in a separate thread."""
-                        thread = threading.Thread(target=forward_request, args=(data,))
-                        thread.start()
-                        # Acknowledge the message after processing
-                        redis_client.xack(REDIS_STREAM_NAME, CONSUMER_GROUP, entry_id)
+            payload = decode_entry(data)
+        except Exception as e:
+            await self.dead_letter(stream, entry_id, data, attempt, f"Undecodable entry: {e}")
+            return
+        session = str(payload.get("session_id") or "")
+        self.in_flight.setdefault(stream, set()).add(entry_id)
+        if session in self.spilled or len(self.sessions.get(session, ())) >= SESSION_BUFFER:
+            # Left pending, fetched back in order once the session catches up
+            self.spilled.setdefault(session, deque()).append((stream, entry_id, attempt))
+            return
+        self.buffer(session, (stream, entry_id, data, payload, attempt))
+
+    def buffer(self, session: str, entry: tuple) -> None:
+        """Append a decoded entry to its session and hand the session to the workers if idle"""
+        self.sessions.setdefault(session, deque()).append(entry)
+        self.buffered += 1
+        if self.buffered >= MAX_BUFFERED:
+            self.room.clear()
+        if session not in self.scheduled:
+            self.scheduled.add(session)
+            self.ready.put_nowait(session)
+
+    def hold(self, session: str, delay: float) -> None:
+        """Keep a session away from the workers for `delay` seconds"""
+        self.held[session] = asyncio.get_running_loop().call_later(delay, self.resume, session)
+
+    def resume(self, session: str) -> None:
+        """Hand a held back session to the workers again"""
+        del self.held[session]
+        self.ready.put_nowait(session)
+
+    async def redis_polling(self, stop: asyncio.Event):
+        """Read the owned partitions continuously and buffer their entries"""
+        while not stop.is_set():
+            streams = self.coordinator.readable_streams()
+            self.started.intersection_update(streams)
+            if not streams:
+                # Every partition is owned by other consumers for now
+                await asyncio.sleep(1)
+                continue
+            try:
+                for stream in streams:
+                    if stream not in self.started:
+                        # Older than anything '>' returns, they must be buffered first
+                        await self.claim_pending(stream, 0)
+                        self.started.add(stream)
+                # Only healthy sessions fill the buffer, so it drains at forwarding speed
+                await self.room.wait()
+
+                logger.debug(f"Starting to listen for messages on streams {streams}")
+                messages = await self.redis_client.xreadgroup(
+                    groupname=CONSUMER_GROUP,
+                    consumername=CONSUMER_NAME,
+                    streams={stream: '>' for stream in streams},  # Read new messages
+                    count=READ_COUNT,
+                    block=BLOCK_MS  # Returns as soon as entries arrive
+                )
+
+                if messages:
+                    for stream, entries in messages:
+                        for entry_id, data in entries:
+                            logger.info(f"Processing message {entry_id}: {data}")
+                            await self.enqueue(stream, entry_id, data)
+                else:
+                    logger.debug("No new messages. Polling again...")
+
+            except redis.RedisError as e:
+                logger.error(f"Error in Redis polling: {e}")
+                await asyncio.sleep(5)  # Wait before retrying
+
+    async def reclaim_pending(self, stop: asyncio.Event):
+        """Periodically take over entries of owned partitions left pending by crashed or stuck consumers"""
+        while not stop.is_set():
+            for stream in self.coordinator.readable_streams():
+                try:
+                    await self.claim_pending(stream, RECLAIM_IDLE_MS)
+                except redis.RedisError as e:
+                    logger.error(f"Error reclaiming pending messages of {stream}: {e}")
+            await asyncio.sleep(RECLAIM_INTERVAL)
+
+    async def claim_pending(self, stream: str, min_idle_time: int):
+        """Claim the entries of a partition pending for at least `min_idle_time` ms and buffer them"""
+        start_id = "0-0"
+        while True:
+            # Redis 7 also returns the IDs of deleted entries as a third element
+            start_id, entries = (await self.redis_client.xautoclaim(
+                stream, CONSUMER_GROUP, CONSUMER_NAME,
+                min_idle_time=min_idle_time, start_id=start_id, count=READ_COUNT))[:2]
+            if entries:
+                await self.enqueue_reclaimed(stream, entries)
+            if start_id == "0-0":
+                break
+
+    async def enqueue_reclaimed(self, stream: str, entries):
+        """Buffer reclaimed entries not already in flight, counting every delivery as an attempt"""
+        # Every claimed entry lies in this range, so it also holds the delivery counts of the ones kept
+        pending = await self.redis_client.xpending_range(
+            stream, CONSUMER_GROUP, min=entries[0][0], max=entries[-1][0], count=len(entries))
+        deliveries = {item["message_id"]: item["times_delivered"] for item in pending}
+        in_flight = self.in_flight.get(stream, set())
+        for entry_id, data in entries:
+            if entry_id in in_flight:
+                continue
+            if data is None:
+                # Trimmed from the stream while pending, nothing left to deliver
+                await self.redis_client.xack(stream, CONSUMER_GROUP, entry_id)
+                continue
+            attempt = deliveries.get(entry_id, 1)
+            logger.warning(f"Reclaimed message {entry_id}, delivery {attempt}")
+            if attempt > MAX_ATTEMPTS:
+                # Keeps taking its consumers down before an outcome is recorded
+                await self.dead_letter(stream, entry_id, data, attempt - 1, "Delivered too many times")
+                continue
+            await self.enqueue(stream, entry_id, data, attempt)
+
+    async def worker(self):
+        """Forward ready sessions in micro-batches until stopped"""
+        loop = asyncio.get_running_loop()
+        while True:
+            session = await self.ready.get()
+            if session is None:
+                return
+            sessions, size = [session], len(self.sessions[session])
+            deadline = loop.time() + BATCH_WAIT_MS / 1000
+            while size < BATCH_SIZE:
+                try:
+                    session = (self.ready.get_nowait() if not self.ready.empty()
+                               else await asyncio.wait_for(self.ready.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if session is None:
+                    # Stopping, finish this batch first
+                    self.ready.put_nowait(None)
+                    break
+                sessions.append(session)
+                size += len(self.sessions[session])
+            await self.process(sessions)
+
+    async def process(self, sessions):
+        """Forward the buffered entries of some sessions in one batch, then acknowledge, dead-letter or hold back each"""
+        batch, room = [], BATCH_SIZE
+        for session in sessions:
+            entries = list(islice(self.sessions[session], max(room, 0)))
+            batch.extend((session, entry) for entry in entries)
+            room -= len(entries)
+        try:
+            errors = await forward_batch(self.http_client, [entry[3] for _, entry in batch]) if batch else []
+            batch_failed = False
+        except HTTPException as e:
+            errors = [e] * len(batch)
+            batch_failed = True
+
+        acks, finished, blocked = {}, [], set()
+        for (session, (stream, entry_id, data, payload, attempt)), error in zip(batch, errors):
+            if session in blocked:
+                # Behind a failed entry of its session, stays buffered in order
+                continue
+            if error is not None and error.status_code == 424 and not batch_failed:
+                # Skipped behind a failed entry of its session, it was never tried
+                blocked.add(session)
+                continue
+            if error is None:
+                acks.setdefault(stream, []).append(entry_id)
+            else:
+                logger.error(f"Failed to forward message {entry_id} (attempt {attempt}): {error.detail}")
+                if attempt >= MAX_ATTEMPTS or not is_retryable(error):
+                    await self.dead_letter(stream, entry_id, data, attempt, str(error.detail))
+                else:
+                    # Only this session waits, the workers move on to the others
+                    self.sessions[session][0] = (stream, entry_id, data, payload, attempt + 1)
+                    self.hold(session, retry_delay(attempt))
+                    blocked.add(session)
+                    continue
+            self.sessions[session].popleft()
+            finished.append((stream, entry_id))
+        await self.acknowledge(acks)
+
+        for stream, entry_id in finished:
+            self.in_flight.get(stream, set()).discard(entry_id)
+        self.buffered -= len(finished)
+        if self.buffered < MAX_BUFFERED:
+            self.room.set()
+        for session in sessions:
+            if self.stopping or session in self.held:
+                continue
+            if session in self.spilled and len(self.sessions[session]) < SESSION_BUFFER:
+                await self.refill(session)
+                if session in self.held:
+                    continue
+            if self.sessions[session] or session in self.spilled:
+                self.ready.put_nowait(session)
             else:
-                logger.debug("No new messages. Polling again...")
+                del self.sessions[session]
+                self.scheduled.discard(session)
 
-            time.sleep(1)
-        except Exception as e:
-            print(f"Error in Redis polling: {e}")
-            time.sleep(5)  # Wait before retrying
+    async def refill(self, session: str):
+        """Fetch back, in order, the entries of a session left pending while its buffer was full"""
+        spilled = self.spilled[session]
+        wanted = list(islice(spilled, SESSION_BUFFER - len(self.sessions[session])))
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for stream, entry_id, _ in wanted:
+                    pipe.xrange(stream, min=entry_id, max=entry_id, count=1)
+                found = await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Failed to fetch pending messages of session {session}: {e}")
+            self.hold(session, retry_delay(1))
+            return
+
+        for (stream, entry_id, attempt), entries in zip(wanted, found):
+            spilled.popleft()
+            if not entries:
+                # Trimmed from the stream while pending, nothing left to deliver
+                self.in_flight.get(stream, set()).discard(entry_id)
+                await self.acknowledge_trimmed(stream, entry_id)
+                continue
+            data = entries[0][1]
+            try:
+                payload = decode_entry(data)
+            except Exception as e:
+                self.in_flight.get(stream, set()).discard(entry_id)
+                await self.dead_letter(stream, entry_id, data, attempt, f"Undecodable entry: {e}")
+                continue
+            self.buffer(session, (stream, entry_id, data, payload, attempt))
+        if not spilled:
+            del self.spilled[session]
+
+    async def acknowledge_trimmed(self, stream: str, entry_id: str):
+        """Acknowledge an entry trimmed from the stream before it could be forwarded"""
+        try:
+            await self.redis_client.xack(stream, CONSUMER_GROUP, entry_id)
+        except redis.RedisError as e:
+            logger.error(f"Failed to acknowledge trimmed message {entry_id}: {e}")
+
+    async def close(self, workers):
+        """Let the workers finish their batches, leaving whatever is still buffered pending for the next owner"""
+        self.stopping = True
+        for timer in self.held.values():
+            timer.cancel()
+        for _ in workers:
+            self.ready.put_nowait(None)
+        await asyncio.gather(*workers)
+
+    async def acknowledge(self, acks):
+        """Acknowledge the forwarded entries of every stream in one round trip"""
+        if not acks:
+            return
+        for stream, entry_ids in acks.items():
+            observe_forwarded(stream, entry_ids)
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for stream, entry_ids in acks.items():
+                    pipe.xack(stream, CONSUMER_GROUP, *entry_ids)
+                await pipe.execute()
+        except redis.RedisError as e:
+            # Left pending, they will be reclaimed and delivered again
+            logger.error(f"Failed to acknowledge {sum(map(len, acks.values()))} message(s): {e}")
+
+    async def dead_letter(self, stream: str, entry_id: str, data: dict, attempts: int, reason: str):
+        """Move an entry to the dead-letter stream and acknowledge it in one transaction"""
+        fields = {**data, "source_stream": stream, "source_id": entry_id, "attempts": attempts, "error": reason}
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.xadd(DEAD_LETTER_STREAM, fields, "*", maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+                pipe.xack(stream, CONSUMER_GROUP, entry_id)
+                await pipe.execute()
+            observe_dead_lettered(stream)
+            logger.error(f"Moved message {entry_id} to {DEAD_LETTER_STREAM} after {attempts} attempt(s)")
+        except redis.RedisError as e:
+            logger.error(f"Failed to dead-letter message {entry_id}: {e}")
+
+
+def decode_entry(data: dict) -> dict:
+    """Decode a stream entry into the AIQueryResponse payload"""
+    try:
+        return decode_event(data)
+    except StreamDecodeError:
+        # Entries written before the versioned wire format was introduced
+        return parse_legacy_event(dict(data))
 
 
-def forward_request(ai_query_response):
+def parse_legacy_event(ai_query_response):
+    """Parse an unversioned entry whose fields hold `str()` flattened values"""
+    # Ensure `result` is correctly parsed as a dictionary
+    if isinstance(ai_query_response["result"], str):
+        try:
+            ai_query_response["result"] = json.loads(ai_query_response["result"].replace("'", '"'))
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON Decode Error: {str(e)} - Raw Data: {ai_query_response['result']}")
+            ai_query_response["result"] = {"error": "Invalid result format"}
+
+    # Handle metadata as a string that contains Python dict notation
+    if isinstance(ai_query_response["metadata"], str):
+        # Create a new clean metadata dictionary
+        metadata_dict = {}
+
+        # Extract key pieces of info using string manipulation instead of trying to parse as JSON
+        metadata_str = ai_query_response["metadata"]
+
+        # Extract app_id
+        if "'app_id': '" in metadata_str:
+            app_id_start = metadata_str.index("'app_id': '") + len("'app_id': '")
+            app_id_end = metadata_str.index("'", app_id_start)
+            metadata_dict["app_id"] = metadata_str[app_id_start:app_id_end]
+
+        # Extract needs_verification
+        if "'needs_verification': " in metadata_str:
+            needs_verification_str = "True"
+            if "'needs_verification': False" in metadata_str:
+                needs_verification_str = "False"
+            metadata_dict["needs_verification"] = needs_verification_str == "True"
+
+        # Add a properly formatted timestamp
+        metadata_dict["timestamp"] = datetime.now().isoformat()
+
+        # Replace the string metadata with our dictionary
+        ai_query_response["metadata"] = metadata_dict
+
+    # Convert `id` to an integer if it's a valid number
+    if "id" in ai_query_response and isinstance(ai_query_response["id"], str) and ai_query_response[
+        "id"].isdigit():
+        ai_query_response["id"] = int(ai_query_response["id"])
+    return ai_query_response
+
+
+async def forward_request(client: httpx.AsyncClient, ai_query_response):
     logger.info("Forwarding request")
-    with httpx.Client() as client:  # Use synchronous `httpx.Client()` instead of `asyncClient`
+    try:
+        logger.info(f"Formatted Data Before Sending: {ai_query_response}")
+
+        response = await client.post(POSTPROCESSING_API_URL, json=ai_query_response)
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code,
+                                detail=f"Failed to send AIQueryResponse to external API: {response.text}")
+
+    except HTTPException:
+        raise
+
+    except httpx.HTTPStatusError as http_err:
+        logger.error(f"HTTP Error: {http_err.response.status_code} - {http_err.response.text}")
+        raise HTTPException(status_code=http_err.response.status_code,
+                            detail=f"External API Error: {http_err.response.text}")
+
+    except httpx.RequestError as req_err:
+        logger.error(f"Request Error: {str(req_err)}")
+        raise HTTPException(status_code=500,
+                            detail=f"Failed to send request to postprocessing API: {str(req_err)}")
+
+    except ValueError:
+        raise HTTPException(status_code=500,
+                            detail=f"Invalid JSON received from postprocessing API: {response.text}")
+
+    except Exception as e:
+        error_type = type(e).__name__  # Get the exception type
+        error_details = traceback.format_exc()  # Get full traceback
+        logger.error(f"Exception Type: {error_type}\nDetails: {error_details}")
+        raise HTTPException(status_code=500, detail=f"Unexpected error ({error_type}): {str(e)}")
+
+
+async def forward_batch(client: httpx.AsyncClient, ai_query_responses):
+    """
+    Forward several responses in one request.
+    Returns one entry per response: None when it was accepted, otherwise the HTTPException describing the failure.
+    A batch of one is sent to the single-response endpoint.
+    """
+    if len(ai_query_responses) == 1:
         try:
-            # Ensure `result` is correctly parsed as a dictionary
-            if isinstance(ai_query_response["result"], str):
-                try:
-                    ai_query_response["result"] = json.loads(ai_query_response["result"].replace("'", '"'))
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON Decode Error: {str(e)} - Raw Data: {ai_query_response['result']}")
-                    ai_query_response["result"] = {"error": "Invalid result format"}
-
-            # Handle metadata as a string that contains Python dict notation
-            if isinstance(ai_query_response["metadata"], str):
-                # Create a new clean metadata dictionary
-                metadata_dict = {}
-
-                # Extract key pieces of info using string manipulation instead of trying to parse as JSON
-                metadata_str = ai_query_response["metadata"]
-
-                # Extract app_id
-                if "'app_id': '" in metadata_str:
-                    app_id_start = metadata_str.index("'app_id': '") + len("'app_id': '")
-                    app_id_end = metadata_str.index("'", app_id_start)
-                    metadata_dict["app_id"] = metadata_str[app_id_start:app_id_end]
-
-                # Extract needs_verification
-                if "'needs_verification': " in metadata_str:
-                    needs_verification_str = "True"
-                    if "'needs_verification': False" in metadata_str:
-                        needs_verification_str = "False"
-                    metadata_dict["needs_verification"] = needs_verification_str == "True"
-
-                # Add a properly formatted timestamp
-                metadata_dict["timestamp"] = datetime.now().isoformat()
-
-                # Replace the string metadata with our dictionary
-                ai_query_response["metadata"] = metadata_dict
-
-            # Convert `id` to an integer if it's a valid number
-            if "id" in ai_query_response and isinstance(ai_query_response["id"], str) and ai_query_response[
-                "id"].isdigit():
-                ai_query_response["id"] = int(ai_query_response["id"])
-
-            logger.info(f"Formatted Data Before Sending: {ai_query_response}")
-
-            response = client.post(POSTPROCESSING_API_URL, json=ai_query_response)
-            if response.status_code != 200:
-                raise HTTPException(status_code=500,
-                                    detail=f"Failed to send AIQueryResponse to external API: {response.text}")
-
-        except httpx.HTTPStatusError as http_err:
-            logger.error(f"HTTP Error: {http_err.response.status_code} - {http_err.response.text}")
-            raise HTTPException(status_code=http_err.response.status_code,
-                                detail=f"External API Error: {http_err.response.text}")
-
-        except httpx.RequestError as req_err:
-            logger.error(f"Request Error: {str(req_err)}")
-            raise HTTPException(status_code=500,
-                                detail=f"Failed to send request to postprocessing API: {str(req_err)}")
-
-        except ValueError:
-            raise HTTPException(status_code=500,
-                                detail=f"Invalid JSON received from postprocessing API: {response.text}")
+            await forward_request(client, ai_query_responses[0])
+            return [None]
+        except HTTPException as e:
+            return [e]
 
-        except Exception as e:
-            error_type = type(e).__name__  # Get the exception type
-            error_details = traceback.format_exc()  # Get full traceback
-            logger.error(f"Exception Type: {error_type}\nDetails: {error_details}")
-            raise HTTPException(status_code=500, detail=f"Unexpected error ({error_type}): {str(e)}")
-
-# Keep the main thread alive
-try:
-    redis_polling()
-except KeyboardInterrupt:
-    print("Shutting down...")
+    logger.info(f"Forwarding batch of {len(ai_query_responses)} requests")
+    try:
+        response = await client.post(POSTPROCESSING_BATCH_URL, json=ai_query_responses)
+    except httpx.RequestError as req_err:
+        logger.error(f"Request Error: {str(req_err)}")
+        raise HTTPException(status_code=500,
+                            detail=f"Failed to send request to postprocessing API: {str(req_err)}")
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code,
+                            detail=f"Failed to send AIQueryResponse batch to external API: {response.text}")
+    try:
+        results = response.json()
+        if len(results) != len(ai_query_responses):
+            raise ValueError("One result per response expected")
+        return [None if result["status_code"] == 200
+                else HTTPException(status_code=result["status_code"], detail=result.get("error"))
+                for result in sorted(results, key=lambda result: result["index"])]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=500,
+                            detail=f"Invalid JSON received from postprocessing API: {response.text}")
+
+
+async def main():
+    """Run the partition coordinator, the stream readers, the workers and metrics until SIGTERM/SIGINT"""
+    redis_client = await connect_to_redis()
+    start_metrics_server()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with create_http_client() as http_client:
+        coordinator = PartitionCoordinator(redis_client, REDIS_STREAM_NAME, CONSUMER_GROUP, CONSUMER_NAME)
+        consumer = StreamConsumer(redis_client, http_client, coordinator)
+        workers = [asyncio.create_task(consumer.worker()) for _ in range(WORKER_COUNT)]
+        readers = [asyncio.create_task(coordinator.run(stop, consumer.drained)),
+                   asyncio.create_task(consumer.redis_polling(stop)),
+                   asyncio.create_task(consumer.reclaim_pending(stop)),
+                   asyncio.create_task(collect_metrics(redis_client, coordinator.streams,
+                                                       coordinator.readable_streams, stop))]
+        logger.info(f"Consumer {CONSUMER_NAME} listening on {len(coordinator.streams)} partition(s) of '{REDIS_STREAM_NAME}'")
+        await stop.wait()
+        print("Shutting down...")
+
+        # Stop reading and finish the batches being forwarded, the next owner takes over what is left
+        for task in readers:
+            task.cancel()
+        await consumer.close(workers)
+        await coordinator.close()
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Encode benchmark of Mongo documents, run with `python tests/bench_jsonencoder.py`.
+Compares the shared single-pass encoder with the former recursive ObjectId walk
+followed by `json.dumps`, on a 100-query session page and a long chat history.
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+from enum import Enum
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from common.jsonencoder import dumps, orjson  # noqa: E402
+
+
+class UserRole(Enum):
+    User = "user"
+    Assistant = "assistant"
+
+
+SESSION_PAGE = [{
+    "_id": ObjectId(),
+    "id": query_id,
+    "user_id": "user",
+    "session_id": "session",
+    "metadata": {"timestamp": datetime.now().isoformat(), "app_id": "example.app", "needs_verification": True},
+    "usercommand": "Show me all transactions with $200 from last month grouped by category.",
+} for query_id in range(100)]
+
+CHAT_HISTORY = {
+    "user_id": "user",
+    "session_id": "session",
+    "metadata": {"created_at": datetime.now(), "last_updated_at": datetime.now(), "app_id": "example.app"},
+    "messages": [{
+        "id": index // 2,
+        "timestamp": datetime.now(),
+        "role": UserRole.User if index % 2 == 0 else UserRole.Assistant,
+        "usercommand": "Are you looking for transactions with an amount of $200 as expenses, income, or both?",
+    } for index in range(2000)],
+}
+
+
+def serialize_mongo_data(data):
+    """Former recursive walk converting ObjectIds, copying every dict and list"""
+    if isinstance(data, list):
+        return [serialize_mongo_data(item) for item in data]
+    elif isinstance(data, dict):
+        return {key: serialize_mongo_data(value) for key, value in data.items()}
+    elif isinstance(data, ObjectId):
+        return str(data)
+    return data
+
+
+def serialize_for_json(obj):
+    """Former `json.dumps` fallback for datetimes and roles"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, UserRole):
+        return obj.value
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def bench(name: str, fn, number: int) -> None:
+    """Print the mean time of one call"""
+    seconds = min(timeit.repeat(fn, number=number, repeat=5))
+    print(f"{name:<24} {seconds / number * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    print(f"Backend: {'orjson' if orjson else 'json'}")
+    bench("session page, former", lambda: json.dumps(serialize_mongo_data(SESSION_PAGE)), 2000)
+    bench("session page, shared", lambda: dumps(SESSION_PAGE), 2000)
+    bench("chat history, former",
+          lambda: json.dumps(serialize_mongo_data(CHAT_HISTORY), default=serialize_for_json), 50)
+    bench("chat history, shared", lambda: dumps(CHAT_HISTORY), 50)
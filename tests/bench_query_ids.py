@@ -0,0 +1,76 @@
+"""
+Query id allocation benchmark, run with `python tests/bench_query_ids.py` against a local MongoDB.
+Compares insert throughput with one counter `$inc` per insert against the
+block allocator, writing to a scratch database only.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", path)
+                for path in ("", "api-preprocessing")]
+
+import mongodb  # noqa: E402
+
+INSERTS = int(os.getenv("BENCH_INSERTS", "5000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+BENCH_DATABASE = "adaptAiBenchDatabase"
+
+
+def query_document(query_id: int) -> dict:
+    """Representative stored query"""
+    return {"id": query_id, "user_id": "user", "session_id": "session",
+            "metadata": {"app_id": "example.app", "needs_verification": True},
+            "usercommand": "Search the amount by Expense."}
+
+
+async def per_insert_counter(collection) -> int:
+    """Former behaviour, one atomic counter round trip for every insert"""
+    counter = await collection.database.counters.find_one_and_update(
+        {"_id": "query_id"}, {"$inc": {"seq": 1}}, return_document=True, upsert=True)
+    return counter["seq"]
+
+
+async def run(name: str, collection, next_id) -> None:
+    """Insert INSERTS queries with CONCURRENCY in flight and print the throughput"""
+    await collection.drop()
+    await collection.database.counters.drop()
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def insert():
+        async with semaphore:
+            await collection.insert_one(query_document(await next_id()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(insert() for _ in range(INSERTS)))
+    print(f"{name:<12} {INSERTS / (time.perf_counter() - started):8.0f} inserts/s")
+
+
+async def main() -> None:
+    try:
+        with pymongo.timeout(2):
+            await mongodb.client.admin.command("ping")
+    except PyMongoError:
+        print(f"MongoDB is not available at {mongodb.MONGO_URI or 'localhost'}")
+        return
+    # The allocator reads the module collection, point it at the scratch database
+    collection = mongodb.client[BENCH_DATABASE].queries
+    mongodb.queries_collection = collection
+    try:
+        await run("per-insert", collection, lambda: per_insert_counter(collection))
+        allocator = mongodb.IdBlockAllocator()
+
+        async def block_id() -> int:
+            return (await allocator.next_ids(1))[0]
+
+        await run("block", collection, block_id)
+    finally:
+        await mongodb.client.drop_database(BENCH_DATABASE)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""
+Stream listener throughput benchmark, run with `python tests/bench_stream_listener.py` against a local Redis.
+Compares the former thread per entry, each with its own httpx client and a
+one second sleep after every read, with the asyncio `StreamConsumer`,
+forwarding to a local stub postprocessing server on a scratch stream.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import httpx
+import redis
+import redis.asyncio as aioredis
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", path)
+                for path in ("", "redis-stream-listeners")]
+os.environ.setdefault("REDIS_HOST", "localhost")
+
+import redisstream_listener as listener  # noqa: E402
+from common.streamcodec import encode_event  # noqa: E402
+from partitions import PartitionCoordinator  # noqa: E402
+from stubserver import start_stub_server  # noqa: E402
+
+ENTRIES = int(os.getenv("BENCH_ENTRIES", "2000"))
+SESSIONS = int(os.getenv("BENCH_SESSIONS", "200"))
+# Seconds postprocessing takes per request
+DELAY = float(os.getenv("BENCH_DELAY", "0.005"))
+BENCH_STREAM = "bench_preprocess_request"
+
+forwarded = 0
+
+
+def respond(path: str, body: bytes) -> bytes:
+    """Accept every response, one result per entry for batches"""
+    global forwarded
+    if path.endswith("/batch"):
+        count = len(json.loads(body))
+        forwarded += count
+        return json.dumps([{"index": index, "status_code": 200} for index in range(count)]).encode()
+    forwarded += 1
+    return b"{}"
+
+
+def payload(index: int) -> dict:
+    """Representative AIQueryResponse"""
+    return {"id": index, "user_id": "user", "session_id": f"session-{index % SESSIONS}",
+            "usercommand": "Search the amount by Expense.",
+            "metadata": {"app_id": "example.app", "needs_verification": True},
+            "result": {"response": "Yes", "model": "ChatGPT"}}
+
+
+def thread_per_entry(url: str) -> None:
+    """Former behaviour, a thread and a new client per entry and a fixed sleep after every read"""
+    client = redis.Redis(host=listener.REDIS_HOST, port=listener.REDIS_PORT, decode_responses=True)
+    client.xgroup_create(BENCH_STREAM, "bench-former", id="0")
+
+    def forward(entry_id: str, data: dict) -> None:
+        with httpx.Client() as http_client:
+            http_client.post(url, json=listener.decode_entry(data)).raise_for_status()
+        client.xack(BENCH_STREAM, "bench-former", entry_id)
+
+    threads = []
+    while forwarded < ENTRIES:
+        messages = client.xreadgroup("bench-former", "former", {BENCH_STREAM: ">"}, count=listener.READ_COUNT)
+        for _, entries in messages or []:
+            for entry_id, data in entries:
+                thread = threading.Thread(target=forward, args=(entry_id, data))
+                thread.start()
+                threads.append(thread)
+        time.sleep(1)
+    for thread in threads:
+        thread.join()
+    client.close()
+
+
+async def stream_consumer(redis_client, http_client) -> None:
+    """Current behaviour, the worker pool of the listener until every entry was forwarded"""
+    stop = asyncio.Event()
+    coordinator = PartitionCoordinator(redis_client, BENCH_STREAM, listener.CONSUMER_GROUP, "bench-consumer")
+    consumer = listener.StreamConsumer(redis_client, http_client, coordinator)
+    await coordinator.rebalance(consumer.drained)
+    workers = [asyncio.create_task(consumer.worker()) for _ in range(listener.WORKER_COUNT)]
+    reader = asyncio.create_task(consumer.redis_polling(stop))
+    while forwarded < ENTRIES or consumer.buffered:
+        await asyncio.sleep(0.01)
+    stop.set()
+    reader.cancel()
+    await consumer.close(workers)
+    await coordinator.close()
+
+
+async def run(name: str, call) -> None:
+    """Forward ENTRIES entries and print the throughput"""
+    global forwarded
+    forwarded = 0
+    started = time.perf_counter()
+    await call()
+    print(f"{name:<16} {ENTRIES / (time.perf_counter() - started):8.0f} entries/s")
+
+
+async def main() -> None:
+    redis_client = aioredis.Redis(host=listener.REDIS_HOST, port=listener.REDIS_PORT, decode_responses=True,
+                                  socket_timeout=listener.BLOCK_MS / 1000 + 5)
+    try:
+        await redis_client.ping()
+    except aioredis.RedisError:
+        print(f"Redis is not available at {listener.REDIS_HOST}:{listener.REDIS_PORT}")
+        return
+
+    server, base_url = await start_stub_server(respond, delay=DELAY)
+    # The module reads its URLs at import, point them at the stub
+    listener.POSTPROCESSING_API_URL = f"{base_url}/postprocessing/"
+    listener.POSTPROCESSING_BATCH_URL = f"{base_url}/postprocessing/batch"
+    try:
+        async with server, listener.create_http_client() as http_client:
+            await redis_client.delete(BENCH_STREAM)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for index in range(ENTRIES):
+                    pipe.xadd(BENCH_STREAM, encode_event(payload(index)))
+                await pipe.execute()
+
+            await run("thread-per-entry",
+                      lambda: asyncio.to_thread(thread_per_entry, listener.POSTPROCESSING_API_URL))
+            await run("worker pool", lambda: stream_consumer(redis_client, http_client))
+    finally:
+        await redis_client.delete(BENCH_STREAM, PartitionCoordinator.lease_key(BENCH_STREAM),
+                                  f"{BENCH_STREAM}:consumers")
+        await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+"""
+Decode benchmark of stream entries, run with `python tests/bench_streamcodec.py`.
+Compares the versioned wire format with the legacy `str()` flattened entries.
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", path)
+                for path in ("", "redis-stream-listeners")]
+
+from common.streamcodec import decode_event, encode_event  # noqa: E402
+from redisstream_listener import parse_legacy_event  # noqa: E402
+
+PAYLOAD = {
+    "id": 42,
+    "user_id": "user",
+    "session_id": "session",
+    "usercommand": "Search the amount by Expense.",
+    "metadata": {"timestamp": datetime.now(), "app_id": "example.app", "needs_verification": True},
+    "result": {"response": "Yes", "model": "ChatGPT"},
+}
+LEGACY = {key: str(value) for key, value in PAYLOAD.items()}
+CURRENT = encode_event(PAYLOAD)
+
+
+def bench(name: str, fn, number: int = 100000) -> None:
+    """Print the mean time of one call"""
+    seconds = min(timeit.repeat(fn, number=number, repeat=5))
+    print(f"{name:<10} {seconds / number * 1e6:.2f} us/entry")
+
+
+if __name__ == "__main__":
+    bench("current", lambda: decode_event(CURRENT))
+    bench("legacy", lambda: parse_legacy_event(dict(LEGACY)))
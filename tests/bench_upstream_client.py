@@ -0,0 +1,63 @@
+"""
+Gateway upstream client benchmark, run with `python tests/bench_upstream_client.py`.
+Compares a new httpx client per proxied call with the pooled keep-alive client
+built by `upstreams.create_client`, against a local stub upstream.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", path)
+                for path in ("", "api-gateway")]
+
+from stubserver import start_stub_server  # noqa: E402
+from upstreams import create_client  # noqa: E402
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+BODY = b'[{"id":1,"usercommand":"Search the amount by Expense."}]'
+
+
+async def per_request_client(base_url: str) -> None:
+    """Former behaviour, a new client and TCP connection for every call"""
+    async with httpx.AsyncClient() as client:
+        (await client.get(f"{base_url}/queries/")).raise_for_status()
+
+
+async def run(name: str, call) -> None:
+    """Send REQUESTS calls with CONCURRENCY in flight and print throughput and latency"""
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def timed():
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{name:<12} {REQUESTS / elapsed:8.0f} req/s"
+          f"  p50 {statistics.median(latencies) * 1000:6.2f} ms"
+          f"  p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.2f} ms")
+
+
+async def main() -> None:
+    server, base_url = await start_stub_server(lambda path, body: BODY)
+    async with server:
+        await run("per-request", lambda: per_request_client(base_url))
+        client = create_client("queries", base_url)
+        try:
+            await run("pooled", lambda: client.get("/queries/"))
+        finally:
+            await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
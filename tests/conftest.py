@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Services import the shared package as `common` and their own modules by name
+ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path[:0] = [ROOT, os.path.join(ROOT, "redis-stream-listeners"), os.path.join(ROOT, "api-preprocessing")]
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Callable, Tuple
+
+# Builds the JSON body answered for a request path and body
+Responder = Callable[[str, bytes], bytes]
+
+
+async def start_stub_server(respond: Responder, delay: float = 0.0) -> Tuple[asyncio.AbstractServer, str]:
+    """
+    Serve a minimal keep-alive HTTP/1.1 endpoint answering 200 to every request.
+    Args:
+        respond: Builds the response body from the request path and body
+        delay: Seconds waited before answering, to stand in for upstream work
+    Returns:
+        Tuple of (server, base URL)
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                path = lines[0].split(" ")[1]
+                headers = {name.lower(): value.strip()
+                           for name, _, value in (line.partition(":") for line in lines[1:] if line)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if delay:
+                    await asyncio.sleep(delay)
+                content = respond(path, body)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(content), content))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
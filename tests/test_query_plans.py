@@ -0,0 +1,59 @@
+import os
+from typing import Any, Dict, List
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from mongodb import QUERY_INDEXES, ROUTE_QUERIES
+
+# Plans are checked on a scratch database, never on the service's data
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+TEST_DATABASE = "adaptAiTestDatabase"
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of a query plan tree"""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            stages.extend(plan_stages(plan[child]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return stages
+
+
+@pytest.fixture(scope="module")
+def queries():
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"MongoDB is not available at {MONGO_URI}")
+
+    collection = client[TEST_DATABASE][f"queries_{os.getpid()}"]
+    collection.drop()
+    collection.create_indexes(QUERY_INDEXES)
+    collection.insert_many([{
+        "id": query_id,
+        "user_id": f"user-{query_id % 5}",
+        "session_id": f"session-{query_id % 7}",
+        "metadata": {"timestamp": "2025-02-01T12:30:15", "app_id": "example.app", "needs_verification": True},
+        "usercommand": "Search the amount by Expense.",
+    } for query_id in range(1, 501)])
+    yield collection
+    collection.drop()
+    client.close()
+
+
+@pytest.mark.parametrize("route", sorted(ROUTE_QUERIES))
+def test_route_query_does_not_scan_the_collection(queries, route):
+    query_filter, sort = ROUTE_QUERIES[route]
+    cursor = queries.find(query_filter)
+    if sort:
+        cursor = cursor.sort(sort)
+
+    stages = plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+
+    assert "COLLSCAN" not in stages, f"{route} scans the collection: {stages}"
@@ -0,0 +1,96 @@
+from datetime import datetime
+from enum import Enum
+
+import pytest
+from bson import ObjectId
+
+from common.streamcodec import (DATA_FIELD, STREAM_FORMAT_VERSION, VERSION_FIELD, StreamDecodeError,
+                                decode_event, encode_event, partition_for, partition_stream, partition_streams)
+from redisstream_listener import decode_entry
+
+
+class Role(Enum):
+    User = "user"
+
+
+def test_round_trip_encodes_datetimes_enums_and_object_ids():
+    object_id = ObjectId()
+    timestamp = datetime(2025, 2, 1, 12, 30, 15, 250000)
+    payload = {
+        "id": 42,
+        "session_id": "session",
+        "metadata": {"timestamp": timestamp, "app_id": "example.app", "needs_verification": False},
+        "role": Role.User,
+        "_id": object_id,
+        "result": {"response": "Yes", "model": "ChatGPT"},
+    }
+
+    fields = encode_event(payload)
+
+    assert fields[VERSION_FIELD] == STREAM_FORMAT_VERSION
+    assert set(fields) == {VERSION_FIELD, DATA_FIELD}
+    assert decode_event(fields) == {
+        **payload,
+        "metadata": {**payload["metadata"], "timestamp": timestamp.isoformat()},
+        "role": "user",
+        "_id": str(object_id),
+    }
+
+
+@pytest.mark.parametrize("fields", [
+    {DATA_FIELD: '{"id":1}'},
+    {VERSION_FIELD: "0", DATA_FIELD: '{"id":1}'},
+    {VERSION_FIELD: "2", DATA_FIELD: '{"id":1}'},
+])
+def test_unknown_version_raises(fields):
+    with pytest.raises(StreamDecodeError):
+        decode_event(fields)
+
+
+@pytest.mark.parametrize("fields", [
+    {VERSION_FIELD: STREAM_FORMAT_VERSION},
+    {VERSION_FIELD: STREAM_FORMAT_VERSION, DATA_FIELD: '{"id":1'},
+    {VERSION_FIELD: STREAM_FORMAT_VERSION, DATA_FIELD: "not json"},
+])
+def test_corrupt_payload_raises(fields):
+    with pytest.raises(StreamDecodeError):
+        decode_event(fields)
+
+
+def test_decode_entry_reads_the_current_format():
+    payload = {"id": 7, "session_id": "session", "metadata": {"app_id": "example.app"}}
+    assert decode_entry(encode_event(payload)) == payload
+
+
+def test_decode_entry_falls_back_to_the_legacy_format():
+    legacy = {
+        "id": "7",
+        "user_id": "user",
+        "session_id": "session",
+        "usercommand": "Search the amount by Expense.",
+        "metadata": "{'timestamp': '2025-02-01T12:30:15', 'app_id': 'example.app', 'needs_verification': False}",
+        "result": "{'response': 'Yes', 'model': 'ChatGPT'}",
+    }
+
+    decoded = decode_entry(legacy)
+
+    assert decoded["id"] == 7
+    assert decoded["result"] == {"response": "Yes", "model": "ChatGPT"}
+    assert decoded["metadata"]["app_id"] == "example.app"
+    assert decoded["metadata"]["needs_verification"] is False
+    assert decoded["usercommand"] == legacy["usercommand"]
+
+
+def test_partition_is_stable_and_in_range():
+    sessions = [f"session-{index}" for index in range(100)]
+    partitions = [partition_for(session, 8) for session in sessions]
+
+    assert partitions == [partition_for(session, 8) for session in sessions]
+    assert all(0 <= partition < 8 for partition in partitions)
+    assert all(partition_for(session, 1) == 0 for session in sessions)
+
+
+def test_single_partition_keeps_the_stream_name():
+    assert partition_stream("preprocess_request", 0, 1) == "preprocess_request"
+    assert partition_streams("preprocess_request", 3) == [
+        "preprocess_request:0", "preprocess_request:1", "preprocess_request:2"]